@@ -1,19 +1,35 @@
 
 import os
+import re
 import json
+import atexit
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Any
 from dotenv import load_dotenv
 from fastmcp import FastMCP
 from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, OperationFailure
+from pymongo.errors import OperationFailure
 import pandas as pd
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Create the MCP server
 mcp = FastMCP("mongodb-flight-server")
 
 load_dotenv()
 
+def _dumps(obj: Any) -> str:
+    """Serialize a tool response; uses orjson's C encoder when it is installed"""
+    # Both paths send datetimes through default=str and write non-ASCII text
+    # as is. One difference remains: NaN and infinity (e.g. a missing price
+    # in imported data) come out as null with orjson and as NaN/Infinity with json
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_INDENT_2 | orjson.OPT_PASSTHROUGH_DATETIME).decode()
+    return json.dumps(obj, indent=2, default=str, ensure_ascii=False)
+
 # MongoDB connection configuration  
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 MONGO_DATABASE = os.getenv("MONGO_DATABASE", "flight_bookings") 
@@ -24,22 +40,77 @@ MONGO_COLLECTION = os.getenv("MONGO_COLLECTION", "flights")
 # PARAMETER NORMALIZATION
 # =============================================================================
 
+# MongoClient is thread-safe and pools connections, so one per process is enough
+_client: Optional[MongoClient] = None
+_collection = None
+
 def get_mongo_client():
-    """Create and return MongoDB client connection"""
+    """Return the shared MongoDB client, creating it on first use"""
+    global _client
+    if _client is None:
+        # No per-call ping: the driver's topology monitor tracks server health
+        _client = MongoClient(MONGO_URI)
+        atexit.register(_client.close)
+    return _client
+
+# Indexes backing the search filters and the Flight_price sort + limit
+FLIGHT_INDEXES = [
+    [("From", 1), ("To", 1), ("Flight_price", 1)],
+    [("Stops", 1), ("Flight_price", 1)],
+    [("Airline", 1)],
+    [("Flight_price", 1)],
+]
+
+def _ensure_indexes(collection):
+    """Create the search indexes if they are missing (no-op when they exist)"""
     try:
-        client = MongoClient(MONGO_URI)
-        
-        # Test connection
-        client.admin.command('ping')
-        return client
-    except ConnectionFailure as e:
-        raise Exception(f"Failed to connect to MongoDB: {str(e)}")
+        for keys in FLIGHT_INDEXES:
+            collection.create_index(keys)
+    except OperationFailure:
+        # Read-only users cannot create indexes; queries still work without them
+        pass
 
 def get_collection():
     """Get the flights collection"""
-    client = get_mongo_client()
-    db = client[MONGO_DATABASE]
-    return db[MONGO_COLLECTION]
+    global _collection
+    if _collection is None:
+        client = get_mongo_client()
+        collection = client[MONGO_DATABASE][MONGO_COLLECTION]
+        _ensure_indexes(collection)
+        _collection = collection
+    return _collection
+
+# Fields the search tools put in their responses; everything else stays on the server
+FLIGHT_PROJECTION = {
+    "_id": 0,
+    "Airline": 1,
+    "From": 1,
+    "To": 1,
+    "Date": 1,
+    "Time_from": 1,
+    "Time_to": 1,
+    "Flight_Duration": 1,
+    "Stops": 1,
+    "class_type": 1,
+    "Flight_price": 1
+}
+
+def _prefix_match(value: str) -> Dict[str, Any]:
+    """Build an anchored, case-sensitive prefix regex, which can use an index"""
+    return {"$regex": f"^{re.escape(value)}"}
+
+def _contains_match(value: str) -> Dict[str, Any]:
+    """Case-insensitive substring match on the escaped input.
+
+    Used for free-text fields like Airline and class_type, where "economy"
+    must still find "Basic Economy" and "Spirit" must find "Frontier, Spirit
+    Airlines"; a case-insensitive regex cannot use an index either way.
+    """
+    return {"$regex": re.escape(value), "$options": "i"}
+
+def _airport_match(code: str) -> Dict[str, Any]:
+    """Airport codes are stored upper-case, so match them case-sensitively"""
+    return _prefix_match(code.strip().upper())
 
 # =============================================================================
 # BASIC MONGODB OPERATIONS
@@ -48,9 +119,9 @@ def get_collection():
 def _test_connection():
     """Internal function to test MongoDB connection"""
     try:
-        client = get_mongo_client()
-        db = client[MONGO_DATABASE]
-        collection = db[MONGO_COLLECTION]
+        # The only explicit ping; it runs at startup and from test_mongodb_connection
+        get_mongo_client().admin.command('ping')
+        collection = get_collection()
         
         # Get basic stats
         doc_count = collection.count_documents({})
@@ -66,7 +137,7 @@ def _test_connection():
             "sample_fields": list(sample.keys()) if sample else []
         }
         
-        return f"MongoDB Connection Test:\n{json.dumps(result, indent=2)}"
+        return f"MongoDB Connection Test:\n{_dumps(result)}"
         
     except Exception as e:
         return f"MongoDB connection failed: {str(e)}"
@@ -90,7 +161,7 @@ def get_database_stats() -> str:
             {"$group": {"_id": "$Airline", "count": {"$sum": 1}}},
             {"$sort": {"count": -1}},
             {"$limit": 10}
-        ]))
+        ], allowDiskUse=False))
         
         # Class type distribution  
         class_stats = list(collection.aggregate([
@@ -102,7 +173,7 @@ def get_database_stats() -> str:
             {"$group": {"_id": {"from": "$From", "to": "$To"}, "count": {"$sum": 1}}},
             {"$sort": {"count": -1}},
             {"$limit": 10}
-        ]))
+        ], allowDiskUse=False))
         
         # Price statistics
         price_stats = list(collection.aggregate([
@@ -122,7 +193,7 @@ def get_database_stats() -> str:
             "price_stats": price_stats[0] if price_stats else {}
         }
         
-        return f"Database Statistics:\n{json.dumps(stats, indent=2, default=str)}"
+        return f"Database Statistics:\n{_dumps(stats)}"
         
     except Exception as e:
         return f"Error getting database stats: {str(e)}"
@@ -150,13 +221,13 @@ def search_flights(
         query = {}
         
         if origin:
-            query["From"] = {"$regex": origin, "$options": "i"}
+            query["From"] = _airport_match(origin)
         if destination:
-            query["To"] = {"$regex": destination, "$options": "i"}
+            query["To"] = _airport_match(destination)
         if airline:
-            query["Airline"] = {"$regex": airline, "$options": "i"}
+            query["Airline"] = _contains_match(airline)
         if class_type:
-            query["class_type"] = {"$regex": class_type, "$options": "i"}
+            query["class_type"] = _contains_match(class_type)
         if max_price > 0:
             query["Flight_price"] = {"$lte": max_price}
         if min_price > 0:
@@ -168,15 +239,14 @@ def search_flights(
             query["Stops"] = {"$lte": max_stops}
         
         # Execute search
-        flights = list(collection.find(query).limit(limit))
+        flights = list(collection.find(query, FLIGHT_PROJECTION).limit(limit))
         
         # Format results
         if not flights:
-            return f"No flights found matching criteria: {json.dumps(query, indent=2)}"
+            return f"No flights found matching criteria: {_dumps(query)}"
         
         results = []
         for flight in flights:
-            flight["_id"] = str(flight["_id"])  # Convert ObjectId to string
             results.append({
                 "airline": flight.get("Airline", "N/A"),
                 "route": f"{flight.get('From', 'N/A')} → {flight.get('To', 'N/A')}",
@@ -189,7 +259,7 @@ def search_flights(
                 "price": flight.get("Flight_price", "N/A")
             })
         
-        return f"Found {len(results)} flights:\n{json.dumps(results, indent=2)}"
+        return f"Found {len(results)} flights:\n{_dumps(results)}"
         
     except Exception as e:
         return f"Error searching flights: {str(e)}"
@@ -201,18 +271,15 @@ def search_by_route(origin: str, destination: str, limit: int = 20) -> str:
         collection = get_collection()
         
         query = {
-            "From": {"$regex": origin, "$options": "i"},
-            "To": {"$regex": destination, "$options": "i"}
+            "From": _airport_match(origin),
+            "To": _airport_match(destination)
         }
         
-        flights = list(collection.find(query).sort("Flight_price", 1).limit(limit))
-        
-        if not flights:
-            return f"No flights found for route: {origin} → {destination}"
+        cursor = collection.find(query, FLIGHT_PROJECTION).sort("Flight_price", 1).limit(limit)
         
-        results = []
-        for flight in flights:
-            results.append({
+        # Format straight off the cursor; no intermediate list of raw documents
+        results = [
+            {
                 "airline": flight.get("Airline"),
                 "date": flight.get("Date"),
                 "departure": flight.get("Time_from"),
@@ -221,9 +288,14 @@ def search_by_route(origin: str, destination: str, limit: int = 20) -> str:
                 "stops": flight.get("Stops"),
                 "class": flight.get("class_type"),
                 "price": f"${flight.get('Flight_price', 0):,.2f}"
-            })
+            }
+            for flight in cursor
+        ]
         
-        return f"Flights from {origin} to {destination} (sorted by price):\n{json.dumps(results, indent=2)}"
+        if not results:
+            return f"No flights found for route: {origin} → {destination}"
+        
+        return f"Flights from {origin} to {destination} (sorted by price):\n{_dumps(results)}"
         
     except Exception as e:
         return f"Error searching route: {str(e)}"
@@ -238,20 +310,21 @@ def search_cheapest_flights(limit: int = 10, max_stops: int = 2) -> str:
         if max_stops >= 0:
             query["Stops"] = {"$lte": max_stops}
         
-        flights = list(collection.find(query).sort("Flight_price", 1).limit(limit))
+        cursor = collection.find(query, FLIGHT_PROJECTION).sort("Flight_price", 1).limit(limit)
         
-        results = []
-        for flight in flights:
-            results.append({
+        results = [
+            {
                 "route": f"{flight.get('From')} → {flight.get('To')}",
                 "airline": flight.get("Airline"),
                 "price": f"${flight.get('Flight_price', 0):,.2f}",
                 "stops": flight.get("Stops"),
                 "duration": flight.get("Flight_Duration"),
                 "class": flight.get("class_type")
-            })
+            }
+            for flight in cursor
+        ]
         
-        return f"Cheapest {limit} flights:\n{json.dumps(results, indent=2)}"
+        return f"Cheapest {limit} flights:\n{_dumps(results)}"
         
     except Exception as e:
         return f"Error finding cheapest flights: {str(e)}"
@@ -268,22 +341,34 @@ def airline_analysis(airline: str = "") -> str:
         
         if airline:
             # Specific airline analysis
-            query = {"Airline": {"$regex": airline, "$options": "i"}}
-            flights = list(collection.find(query))
+            # $match first so only that airline's flights reach $group
+            pipeline = [
+                {"$match": {"Airline": _contains_match(airline)}},
+                {"$group": {
+                    "_id": None,
+                    "total_flights": {"$sum": 1},
+                    "avg_price": {"$avg": {"$ifNull": ["$Flight_price", 0]}},
+                    "routes": {"$addToSet": {"from": "$From", "to": "$To"}}
+                }},
+                {"$project": {
+                    "total_flights": 1,
+                    "avg_price": 1,
+                    "unique_routes": {"$size": "$routes"},
+                    "sample_routes": {"$slice": ["$routes", 10]}
+                }}
+            ]
             
-            if not flights:
-                return f"No flights found for airline: {airline}"
+            stats = next(collection.aggregate(pipeline), None)
             
-            total_flights = len(flights)
-            avg_price = sum(f.get("Flight_price", 0) for f in flights) / total_flights
-            routes = set(f"{f.get('From')} → {f.get('To')}" for f in flights)
+            if not stats:
+                return f"No flights found for airline: {airline}"
             
             result = {
                 "airline": airline,
-                "total_flights": total_flights,
-                "average_price": f"${avg_price:.2f}",
-                "unique_routes": len(routes),
-                "sample_routes": list(routes)[:10]
+                "total_flights": stats["total_flights"],
+                "average_price": f"${stats['avg_price']:.2f}",
+                "unique_routes": stats["unique_routes"],
+                "sample_routes": [f"{r.get('from')} → {r.get('to')}" for r in stats["sample_routes"]]
             }
         else:
             # All airlines comparison
@@ -300,7 +385,7 @@ def airline_analysis(airline: str = "") -> str:
             
             result = list(collection.aggregate(pipeline))
             
-        return f"Airline Analysis:\n{json.dumps(result, indent=2, default=str)}"
+        return f"Airline Analysis:\n{_dumps(result)}"
         
     except Exception as e:
         return f"Error in airline analysis: {str(e)}"
@@ -324,7 +409,9 @@ def route_analysis(limit: int = 15) -> str:
             {"$limit": limit}
         ]
         
-        routes = list(collection.aggregate(pipeline))
+        # $sort directly followed by $limit lets the server keep only a top-N heap;
+        # allowDiskUse=False makes an oversized $group fail instead of spilling to disk
+        routes = list(collection.aggregate(pipeline, allowDiskUse=False))
         
         results = []
         for route in routes:
@@ -336,7 +423,7 @@ def route_analysis(limit: int = 15) -> str:
                 "airlines": len(route["airlines"])
             })
         
-        return f"Top {limit} Routes Analysis:\n{json.dumps(results, indent=2)}"
+        return f"Top {limit} Routes Analysis:\n{_dumps(results)}"
         
     except Exception as e:
         return f"Error in route analysis: {str(e)}"
@@ -347,42 +434,52 @@ def price_distribution_analysis() -> str:
     try:
         collection = get_collection()
         
-        # Price ranges
-        price_ranges = [
-            {"$match": {"Flight_price": {"$lte": 200}}},
-            {"$match": {"Flight_price": {"$gt": 200, "$lte": 500}}},
-            {"$match": {"Flight_price": {"$gt": 500, "$lte": 1000}}},
-            {"$match": {"Flight_price": {"$gt": 1000}}}
-        ]
-        
+        # Upper bound (inclusive) of each price range; anything above the last is Luxury
+        range_bounds = [200, 500, 1000]
         range_labels = ["Budget ($0-200)", "Economy ($200-500)", "Premium ($500-1000)", "Luxury ($1000+)"]
         
-        results = []
-        for i, price_range in enumerate(price_ranges):
-            count = collection.count_documents(price_range["$match"])
-            results.append({
-                "category": range_labels[i],
-                "flight_count": count
-            })
-        
-        # Class type distribution
-        class_pipeline = [
-            {"$group": {
-                "_id": "$class_type",
-                "count": {"$sum": 1},
-                "avg_price": {"$avg": "$Flight_price"}
-            }},
-            {"$sort": {"avg_price": 1}}
+        # Both breakdowns share a single scan of the collection
+        pipeline = [
+            {"$facet": {
+                "price_ranges": [
+                    {"$match": {"Flight_price": {"$type": "number"}}},
+                    {"$group": {
+                        "_id": {"$switch": {
+                            "branches": [
+                                {"case": {"$lte": ["$Flight_price", bound]}, "then": i}
+                                for i, bound in enumerate(range_bounds)
+                            ],
+                            "default": len(range_bounds)
+                        }},
+                        "count": {"$sum": 1}
+                    }}
+                ],
+                "class_distribution": [
+                    {"$group": {
+                        "_id": "$class_type",
+                        "count": {"$sum": 1},
+                        "avg_price": {"$avg": "$Flight_price"}
+                    }},
+                    {"$sort": {"avg_price": 1}}
+                ]
+            }}
         ]
         
-        class_dist = list(collection.aggregate(class_pipeline))
+        facets = next(collection.aggregate(pipeline))
+        range_counts = {r["_id"]: r["count"] for r in facets["price_ranges"]}
+        
+        results = [
+            {"category": label, "flight_count": range_counts.get(i, 0)}
+            for i, label in enumerate(range_labels)
+        ]
+        class_dist = facets["class_distribution"]
         
         analysis = {
             "price_ranges": results,
             "class_distribution": class_dist
         }
         
-        return f"Price Distribution Analysis:\n{json.dumps(analysis, indent=2, default=str)}"
+        return f"Price Distribution Analysis:\n{_dumps(analysis)}"
         
     except Exception as e:
         return f"Error in price analysis: {str(e)}"
@@ -407,15 +504,15 @@ def export_flights_to_csv(
         except json.JSONDecodeError:
             query = {}
         
-        # Get flights
-        flights = list(collection.find(query).limit(limit))
+        # Fetch the whole export in one server batch. batch_size() rejects
+        # negative values while limit(-n) is valid, hence abs(). pandas still
+        # collects the cursor into a list before building the DataFrame
+        cursor = collection.find(query).limit(limit).batch_size(abs(limit))
+        df = pd.DataFrame.from_records(cursor)
         
-        if not flights:
+        if df.empty:
             return f"No flights found matching filter: {query_filter}"
         
-        # Convert to DataFrame
-        df = pd.DataFrame(flights)
-        
         # Remove MongoDB ObjectId and convert to string if present
         if '_id' in df.columns:
             df['_id'] = df['_id'].astype(str)
@@ -423,7 +520,7 @@ def export_flights_to_csv(
         # Save to CSV
         df.to_csv(filename, index=False)
         
-        return f"Successfully exported {len(flights)} flights to {filename}"
+        return f"Successfully exported {len(df)} flights to {filename}"
         
     except Exception as e:
         return f"Error exporting flights: {str(e)}"
@@ -434,15 +531,14 @@ def get_sample_flights(count: int = 5) -> str:
     try:
         collection = get_collection()
         
-        # Get random sample
-        pipeline = [{"$sample": {"size": count}}]
+        # Get random sample, with the ObjectId stringified on the server
+        pipeline = [
+            {"$sample": {"size": count}},
+            {"$project": {**FLIGHT_PROJECTION, "_id": {"$toString": "$_id"}}}
+        ]
         flights = list(collection.aggregate(pipeline))
         
-        # Clean up ObjectId
-        for flight in flights:
-            flight["_id"] = str(flight["_id"])
-        
-        return f"Sample flights ({count}):\n{json.dumps(flights, indent=2, default=str)}"
+        return f"Sample flights ({count}):\n{_dumps(flights)}"
         
     except Exception as e:
         return f"Error getting sample flights: {str(e)}"
@@ -460,7 +556,7 @@ def show_server_config() -> str:
         "collection": MONGO_COLLECTION
     }
     
-    return f"MongoDB Server Configuration:\n{json.dumps(config_display, indent=2)}"
+    return f"MongoDB Server Configuration:\n{_dumps(config_display)}"
 
 # =============================================================================
 # RUN THE SERVER
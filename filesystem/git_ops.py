@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Shared Git helpers for the MCP servers
+Used by git_server.py and mcp_serverhttp.py so both run git the same way
+"""
+
+import asyncio
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import List
+
+# Absolute path to git, resolved once. Together with "-C <repo>" instead of cwd=
+# and close_fds=False this lets CPython start git with posix_spawn (vfork-style)
+# rather than fork+exec, which matters once the server process has grown.
+# close_fds=False is safe: Python creates descriptors non-inheritable (PEP 446).
+GIT_EXECUTABLE = shutil.which("git") or "git"
+
+# Flags for every git invocation:
+# --no-optional-locks  status does not take index.lock just to refresh stat info,
+#                      so it never contends with the user's own git commands
+# core.untrackedCache  status skips directories whose mtime is unchanged; the
+#                      cache is persisted by the commands that do write the index
+GIT_FLAGS = ["--no-optional-locks", "--no-pager", "-c", "core.untrackedCache=true"]
+
+# Environment for git subprocesses, built once at import instead of copying
+# os.environ on every call. The servers do not modify their environment later.
+GIT_ENV = {
+    **os.environ,
+    'GIT_TERMINAL_PROMPT': '0',  # Disable terminal prompts
+    'GIT_ASKPASS': 'echo',       # Provide dummy askpass to avoid hanging
+    'SSH_ASKPASS': 'echo',       # Avoid SSH prompts
+    'GIT_SSH_COMMAND': 'ssh -o BatchMode=yes -o StrictHostKeyChecking=no',
+    'LC_ALL': 'C'                # Skip gettext setup; keeps messages in English
+}
+
+# One pool for the whole process. Threads mostly sit waiting on git, so
+# concurrent tool calls overlap their subprocess latency instead of queueing
+# behind each other on the event loop.
+GIT_EXECUTOR = ThreadPoolExecutor(
+    max_workers=min(32, (os.cpu_count() or 1) * 4),
+    thread_name_prefix="git"
+)
+
+@lru_cache(maxsize=512)
+def abs_path(path: str) -> str:
+    """Absolute form of a path; cached because the servers never change directory"""
+    return os.path.abspath(path)
+
+def decode_output(data: bytes) -> str:
+    """Decode captured git output (always UTF-8); empty output skips the decode
+
+    A clean status, an empty diff and silent commands like add all land on the
+    early return, so the "clean"/"no changes" replies never touch the decoder.
+    """
+    if not data:
+        return ""
+    return data.decode('utf-8', 'replace').strip()
+
+def run_git(args: List[str], cwd: str, timeout: int) -> subprocess.CompletedProcess:
+    """Run git without a pager or prompts; the caller checks returncode
+
+    stdout and stderr are left as bytes so callers only decode what they use.
+
+    Raises subprocess.TimeoutExpired, and FileNotFoundError if git is missing.
+    """
+    return subprocess.run(
+        [GIT_EXECUTABLE, "-C", cwd] + GIT_FLAGS + args,
+        capture_output=True,
+        close_fds=False,
+        check=False,
+        timeout=timeout,
+        env=GIT_ENV
+    )
+
+async def run_git_async(args: List[str], cwd: str, timeout: int) -> subprocess.CompletedProcess:
+    """run_git on the shared executor, so async tools do not block the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(GIT_EXECUTOR, partial(run_git, args, cwd, timeout))
@@ -10,7 +10,7 @@ import subprocess
 import sys
 import os
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Sequence
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
 
 # MCP SDK imports
 try:
@@ -21,6 +21,8 @@ except ImportError:
     print("Error: mcp package not found. Install with: pip install mcp")
     sys.exit(1)
 
+from git_ops import abs_path, decode_output, run_git_async
+
 # Initialize the MCP server
 app = Server("git-server")
 
@@ -28,7 +30,7 @@ class GitError(Exception):
     """Custom exception for Git operations"""
     pass
 
-def run_git_command(args: List[str], cwd: Optional[str] = None, timeout: int = 30) -> str:
+async def run_git_command(args: List[str], cwd: Optional[str] = None, timeout: int = 30) -> str:
     """Run a git command and return the output with timeout and better error handling"""
     try:
         # Ensure we have a valid working directory
@@ -36,382 +38,382 @@ def run_git_command(args: List[str], cwd: Optional[str] = None, timeout: int = 3
             cwd = os.getcwd()
         
         # Convert to absolute path and validate
-        cwd = os.path.abspath(cwd)
+        cwd = abs_path(cwd)
         if not os.path.exists(cwd):
             raise GitError(f"Directory does not exist: {cwd}")
         
-        # Set up environment to avoid interactive prompts
-        env = os.environ.copy()
-        env.update({
-            'GIT_TERMINAL_PROMPT': '0',  # Disable terminal prompts
-            'GIT_ASKPASS': 'echo',       # Provide dummy askpass to avoid hanging
-            'SSH_ASKPASS': 'echo',       # Avoid SSH prompts
-            'GIT_SSH_COMMAND': 'ssh -o BatchMode=yes -o StrictHostKeyChecking=no'
-        })
-        
-        result = subprocess.run(
-            ["git"] + args,
-            capture_output=True,
-            text=True,
-            cwd=cwd,
-            check=True,
-            timeout=timeout,
-            env=env
-        )
-        return result.stdout.strip()
+        result = await run_git_async(args, cwd=cwd, timeout=timeout)
+        if result.returncode != 0:
+            error_msg = decode_output(result.stderr) or "Unknown error"
+            raise GitError(f"Git command failed: {error_msg}")
+        return decode_output(result.stdout)
         
+    except GitError:
+        raise
     except subprocess.TimeoutExpired:
         raise GitError(f"Git command timed out after {timeout} seconds: git {' '.join(args)}")
-    except subprocess.CalledProcessError as e:
-        error_msg = e.stderr.strip() if e.stderr else "Unknown error"
-        raise GitError(f"Git command failed: {error_msg}")
     except FileNotFoundError:
         raise GitError("Git is not installed or not in PATH")
     except Exception as e:
         raise GitError(f"Unexpected error: {str(e)}")
 
-def validate_git_repo(path: str) -> bool:
+# Absolute paths already confirmed as repositories; only successes are remembered
+# so a directory that becomes a repository later is picked up on the next call
+_known_repos = set()
+
+async def validate_git_repo(path: str) -> bool:
     """Check if the given path is a valid Git repository"""
-    try:
-        run_git_command(["rev-parse", "--git-dir"], cwd=path, timeout=5)
+    repo = abs_path(path)
+    if repo in _known_repos:
         return True
+    try:
+        await run_git_command(["rev-parse", "--git-dir"], cwd=path, timeout=5)
     except GitError:
         return False
+    _known_repos.add(repo)
+    return True
 
-@app.list_tools()
-async def list_tools() -> List[types.Tool]:
-    """List available Git tools"""
-    return [
-        types.Tool(
-            name="git_status",
-            description="Get the status of the Git repository",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "path": {
-                        "type": "string",
-                        "description": "Path to the Git repository (optional, defaults to current directory)"
-                    }
+# Tool definitions are static, so they are built once at import rather than
+# re-validating every types.Tool model on each ListTools request
+_TOOLS: List[types.Tool] = [
+    types.Tool(
+        name="git_status",
+        description="Get the status of the Git repository",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "Path to the Git repository (optional, defaults to current directory)"
                 }
             }
-        ),
-        types.Tool(
-            name="git_log",
-            description="Get the Git commit history",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "path": {
-                        "type": "string",
-                        "description": "Path to the Git repository (optional)"
-                    },
-                    "max_count": {
-                        "type": "integer",
-                        "description": "Maximum number of commits to show (default: 10)"
-                    },
-                    "oneline": {
-                        "type": "boolean",
-                        "description": "Show one line per commit (default: false)"
-                    }
+        }
+    ),
+    types.Tool(
+        name="git_log",
+        description="Get the Git commit history",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "Path to the Git repository (optional)"
+                },
+                "max_count": {
+                    "type": "integer",
+                    "description": "Maximum number of commits to show (default: 10)"
+                },
+                "oneline": {
+                    "type": "boolean",
+                    "description": "Show one line per commit (default: false)"
                 }
             }
-        ),
-        types.Tool(
-            name="git_diff",
-            description="Show changes between commits, commit and working tree, etc",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "path": {
-                        "type": "string",
-                        "description": "Path to the Git repository (optional)"
-                    },
-                    "staged": {
-                        "type": "boolean",
-                        "description": "Show staged changes (default: false)"
-                    },
-                    "file": {
-                        "type": "string",
-                        "description": "Show diff for specific file (optional)"
-                    }
+        }
+    ),
+    types.Tool(
+        name="git_diff",
+        description="Show changes between commits, commit and working tree, etc",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "Path to the Git repository (optional)"
+                },
+                "staged": {
+                    "type": "boolean",
+                    "description": "Show staged changes (default: false)"
+                },
+                "file": {
+                    "type": "string",
+                    "description": "Show diff for specific file (optional)"
                 }
             }
-        ),
-        types.Tool(
-            name="git_add",
-            description="Add files to the staging area",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "path": {
-                        "type": "string",
-                        "description": "Path to the Git repository (optional)"
-                    },
-                    "files": {
-                        "type": "array",
-                        "items": {"type": "string"},
-                        "description": "Files to add (use '.' for all files)"
-                    }
+        }
+    ),
+    types.Tool(
+        name="git_add",
+        description="Add files to the staging area",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "Path to the Git repository (optional)"
                 },
-                "required": ["files"]
-            }
-        ),
-        types.Tool(
-            name="git_commit",
-            description="Create a new commit",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "path": {
-                        "type": "string",
-                        "description": "Path to the Git repository (optional)"
-                    },
-                    "message": {
-                        "type": "string",
-                        "description": "Commit message"
-                    },
-                    "all": {
-                        "type": "boolean",
-                        "description": "Commit all modified files (default: false)"
-                    }
+                "files": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Files to add (use '.' for all files)"
+                }
+            },
+            "required": ["files"]
+        }
+    ),
+    types.Tool(
+        name="git_commit",
+        description="Create a new commit",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "Path to the Git repository (optional)"
                 },
-                "required": ["message"]
-            }
-        ),
-        types.Tool(
-            name="git_branch",
-            description="List, create, or delete branches",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "path": {
-                        "type": "string",
-                        "description": "Path to the Git repository (optional)"
-                    },
-                    "list": {
-                        "type": "boolean",
-                        "description": "List all branches (default: true)"
-                    },
-                    "create": {
-                        "type": "string",
-                        "description": "Create a new branch with this name"
-                    },
-                    "delete": {
-                        "type": "string",
-                        "description": "Delete branch with this name"
-                    }
+                "message": {
+                    "type": "string",
+                    "description": "Commit message"
+                },
+                "all": {
+                    "type": "boolean",
+                    "description": "Commit all modified files (default: false)"
                 }
-            }
-        ),
-        types.Tool(
-            name="git_checkout",
-            description="Switch branches or restore working tree files",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "path": {
-                        "type": "string",
-                        "description": "Path to the Git repository (optional)"
-                    },
-                    "branch": {
-                        "type": "string",
-                        "description": "Branch name to checkout"
-                    },
-                    "create": {
-                        "type": "boolean",
-                        "description": "Create new branch if it doesn't exist (default: false)"
-                    }
+            },
+            "required": ["message"]
+        }
+    ),
+    types.Tool(
+        name="git_branch",
+        description="List, create, or delete branches",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "Path to the Git repository (optional)"
                 },
-                "required": ["branch"]
+                "list": {
+                    "type": "boolean",
+                    "description": "List all branches (default: true)"
+                },
+                "create": {
+                    "type": "string",
+                    "description": "Create a new branch with this name"
+                },
+                "delete": {
+                    "type": "string",
+                    "description": "Delete branch with this name"
+                }
             }
-        ),
-        types.Tool(
-            name="git_push",
-            description="Push commits to remote repository",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "path": {
-                        "type": "string",
-                        "description": "Path to the Git repository (optional)"
-                    },
-                    "remote": {
-                        "type": "string",
-                        "description": "Remote name (default: origin)"
-                    },
-                    "branch": {
-                        "type": "string",
-                        "description": "Branch name (optional, defaults to current branch)"
-                    }
+        }
+    ),
+    types.Tool(
+        name="git_checkout",
+        description="Switch branches or restore working tree files",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "Path to the Git repository (optional)"
+                },
+                "branch": {
+                    "type": "string",
+                    "description": "Branch name to checkout"
+                },
+                "create": {
+                    "type": "boolean",
+                    "description": "Create new branch if it doesn't exist (default: false)"
+                }
+            },
+            "required": ["branch"]
+        }
+    ),
+    types.Tool(
+        name="git_push",
+        description="Push commits to remote repository",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "Path to the Git repository (optional)"
+                },
+                "remote": {
+                    "type": "string",
+                    "description": "Remote name (default: origin)"
+                },
+                "branch": {
+                    "type": "string",
+                    "description": "Branch name (optional, defaults to current branch)"
                 }
             }
-        ),
-        types.Tool(
-            name="git_pull",
-            description="Fetch and merge changes from remote repository",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "path": {
-                        "type": "string",
-                        "description": "Path to the Git repository (optional)"
-                    },
-                    "remote": {
-                        "type": "string",
-                        "description": "Remote name (default: origin)"
-                    },
-                    "branch": {
-                        "type": "string",
-                        "description": "Branch name (optional, defaults to current branch)"
-                    }
+        }
+    ),
+    types.Tool(
+        name="git_pull",
+        description="Fetch and merge changes from remote repository",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "Path to the Git repository (optional)"
+                },
+                "remote": {
+                    "type": "string",
+                    "description": "Remote name (default: origin)"
+                },
+                "branch": {
+                    "type": "string",
+                    "description": "Branch name (optional, defaults to current branch)"
                 }
             }
-        ),
-        types.Tool(
-            name="git_init",
-            description="Initialize a new Git repository",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "path": {
-                        "type": "string",
-                        "description": "Path where to initialize the repository (optional)"
-                    }
+        }
+    ),
+    types.Tool(
+        name="git_init",
+        description="Initialize a new Git repository",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "Path where to initialize the repository (optional)"
                 }
             }
-        )
-    ]
+        }
+    )
+]
+
+@app.list_tools()
+async def list_tools() -> List[types.Tool]:
+    """List available Git tools"""
+    return _TOOLS
+
+async def _do_status(path: str, arguments: Dict[str, Any]) -> str:
+    # Try porcelain format first, fall back to regular status
+    try:
+        output = await run_git_command(["status", "--porcelain", "-b"], cwd=path)
+        if not output:
+            return "Working tree clean"
+        # Add a header for better readability
+        return "Repository Status:\n" + output
+    except GitError:
+        return await run_git_command(["status"], cwd=path)
+
+async def _do_log(path: str, arguments: Dict[str, Any]) -> str:
+    max_count = arguments.get("max_count", 10)
+    oneline = arguments.get("oneline", False)
+    
+    args = ["log", f"--max-count={max_count}"]
+    if oneline:
+        args.append("--oneline")
+    else:
+        args.extend(["--pretty=format:%h - %an, %ar : %s"])
+    
+    output = await run_git_command(args, cwd=path)
+    return output or "No commits found"
+
+async def _do_diff(path: str, arguments: Dict[str, Any]) -> str:
+    staged = arguments.get("staged", False)
+    file = arguments.get("file")
+    
+    args = ["diff"]
+    if staged:
+        args.append("--staged")
+    if file:
+        args.append(file)
+    
+    output = await run_git_command(args, cwd=path)
+    return output or "No changes to show"
+
+async def _do_add(path: str, arguments: Dict[str, Any]) -> str:
+    files = arguments["files"]
+    await run_git_command(["add"] + files, cwd=path)
+    return f"Successfully added files: {', '.join(files)}"
+
+async def _do_commit(path: str, arguments: Dict[str, Any]) -> str:
+    message = arguments["message"]
+    all_files = arguments.get("all", False)
+    
+    args = ["commit", "-m", message]
+    if all_files:
+        args.append("-a")
+    
+    return await run_git_command(args, cwd=path)
+
+async def _do_branch(path: str, arguments: Dict[str, Any]) -> str:
+    if arguments.get("create"):
+        branch_name = arguments["create"]
+        await run_git_command(["branch", branch_name], cwd=path)
+        return f"Successfully created branch: {branch_name}"
+    
+    elif arguments.get("delete"):
+        branch_name = arguments["delete"]
+        await run_git_command(["branch", "-d", branch_name], cwd=path)
+        return f"Successfully deleted branch: {branch_name}"
+    
+    output = await run_git_command(["branch", "-a"], cwd=path)
+    return output or "No branches found"
+
+async def _do_checkout(path: str, arguments: Dict[str, Any]) -> str:
+    branch = arguments["branch"]
+    create = arguments.get("create", False)
+    
+    args = ["checkout"]
+    if create:
+        args.append("-b")
+    args.append(branch)
+    
+    return await run_git_command(args, cwd=path)
+
+async def _do_push(path: str, arguments: Dict[str, Any]) -> str:
+    remote = arguments.get("remote", "origin")
+    branch = arguments.get("branch")
+    
+    args = ["push", remote]
+    if branch:
+        args.append(branch)
+    
+    return await run_git_command(args, cwd=path)
+
+async def _do_pull(path: str, arguments: Dict[str, Any]) -> str:
+    remote = arguments.get("remote", "origin")
+    branch = arguments.get("branch")
+    
+    args = ["pull", remote]
+    if branch:
+        args.append(branch)
+    
+    return await run_git_command(args, cwd=path)
+
+async def _do_init(path: str, arguments: Dict[str, Any]) -> str:
+    await run_git_command(["init"], cwd=path)
+    return f"Initialized Git repository at {abs_path(path)}"
+
+# Tool name -> handler; each handler returns the text of the response
+_HANDLERS: Dict[str, Callable[[str, Dict[str, Any]], Awaitable[str]]] = {
+    "git_status": _do_status,
+    "git_log": _do_log,
+    "git_diff": _do_diff,
+    "git_add": _do_add,
+    "git_commit": _do_commit,
+    "git_branch": _do_branch,
+    "git_checkout": _do_checkout,
+    "git_push": _do_push,
+    "git_pull": _do_pull,
+    "git_init": _do_init,
+}
 
 @app.call_tool()
 async def call_tool(name: str, arguments: Dict[str, Any]) -> Sequence[types.TextContent]:
     """Handle tool calls"""
+    handler = _HANDLERS.get(name)
+    if handler is None:
+        return [types.TextContent(type="text", text=f"Unknown tool: {name}")]
+    
     try:
         path = arguments.get("path", ".")
         
         # For init, we don't need to validate the repo exists yet
-        if name != "git_init" and not validate_git_repo(path):
+        if handler is not _do_init and not await validate_git_repo(path):
             return [types.TextContent(
                 type="text", 
                 text=f"Error: {path} is not a valid Git repository. Use git_init to create one."
             )]
         
-        if name == "git_status":
-            # Try porcelain format first, fall back to regular status
-            try:
-                output = run_git_command(["status", "--porcelain", "-b"], cwd=path)
-                if not output:
-                    output = "Working tree clean"
-                else:
-                    # Add a header for better readability
-                    output = "Repository Status:\n" + output
-            except GitError:
-                output = run_git_command(["status"], cwd=path)
-            return [types.TextContent(type="text", text=output)]
-        
-        elif name == "git_log":
-            max_count = arguments.get("max_count", 10)
-            oneline = arguments.get("oneline", False)
-            
-            args = ["log", f"--max-count={max_count}"]
-            if oneline:
-                args.append("--oneline")
-            else:
-                args.extend(["--pretty=format:%h - %an, %ar : %s"])
-            
-            output = run_git_command(args, cwd=path)
-            if not output:
-                output = "No commits found"
-            return [types.TextContent(type="text", text=output)]
-        
-        elif name == "git_diff":
-            staged = arguments.get("staged", False)
-            file = arguments.get("file")
-            
-            args = ["diff"]
-            if staged:
-                args.append("--staged")
-            if file:
-                args.append(file)
-            
-            output = run_git_command(args, cwd=path)
-            if not output:
-                output = "No changes to show"
-            return [types.TextContent(type="text", text=output)]
-        
-        elif name == "git_add":
-            files = arguments["files"]
-            args = ["add"] + files
-            run_git_command(args, cwd=path)
-            return [types.TextContent(type="text", text=f"Successfully added files: {', '.join(files)}")]
-        
-        elif name == "git_commit":
-            message = arguments["message"]
-            all_files = arguments.get("all", False)
-            
-            args = ["commit", "-m", message]
-            if all_files:
-                args.append("-a")
-            
-            output = run_git_command(args, cwd=path)
-            return [types.TextContent(type="text", text=output)]
-        
-        elif name == "git_branch":
-            if arguments.get("create"):
-                branch_name = arguments["create"]
-                run_git_command(["branch", branch_name], cwd=path)
-                return [types.TextContent(type="text", text=f"Successfully created branch: {branch_name}")]
-            
-            elif arguments.get("delete"):
-                branch_name = arguments["delete"]
-                run_git_command(["branch", "-d", branch_name], cwd=path)
-                return [types.TextContent(type="text", text=f"Successfully deleted branch: {branch_name}")]
-            
-            else:
-                output = run_git_command(["branch", "-a"], cwd=path)
-                if not output:
-                    output = "No branches found"
-                return [types.TextContent(type="text", text=output)]
-        
-        elif name == "git_checkout":
-            branch = arguments["branch"]
-            create = arguments.get("create", False)
-            
-            args = ["checkout"]
-            if create:
-                args.append("-b")
-            args.append(branch)
-            
-            output = run_git_command(args, cwd=path)
-            return [types.TextContent(type="text", text=output)]
-        
-        elif name == "git_push":
-            remote = arguments.get("remote", "origin")
-            branch = arguments.get("branch")
-            
-            args = ["push", remote]
-            if branch:
-                args.append(branch)
-            
-            output = run_git_command(args, cwd=path)
-            return [types.TextContent(type="text", text=output)]
-        
-        elif name == "git_pull":
-            remote = arguments.get("remote", "origin")
-            branch = arguments.get("branch")
-            
-            args = ["pull", remote]
-            if branch:
-                args.append(branch)
-            
-            output = run_git_command(args, cwd=path)
-            return [types.TextContent(type="text", text=output)]
-        
-        elif name == "git_init":
-            output = run_git_command(["init"], cwd=path)
-            return [types.TextContent(type="text", text=f"Initialized Git repository at {os.path.abspath(path)}")]
-        
-        else:
-            return [types.TextContent(type="text", text=f"Unknown tool: {name}")]
+        return [types.TextContent(type="text", text=await handler(path, arguments))]
     
     except GitError as e:
         return [types.TextContent(type="text", text=f"Git error: {str(e)}")]
@@ -7,104 +7,189 @@ Provides file system operations
 import os
 import sys
 import json
+import asyncio
+import codecs
+import stat
 import subprocess
+import time
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 from fastmcp import FastMCP
 
+from git_ops import abs_path
+
 # Initialize the MCP server
 mcp = FastMCP("Filesystem")
 
-@mcp.tool()
-def read_file(file_path: str) -> Dict[str, Any]:
-    """Read the contents of a file"""
+# Short-lived stat results, in the spirit of the old statcache module: agents
+# tend to check, read and re-read the same paths within a few milliseconds.
+# Paths this server writes, deletes or creates are forgotten immediately.
+STAT_TTL = 0.2
+_stat_cache: Dict[str, Tuple[float, Optional[os.stat_result]]] = {}
+
+def _stat(path: str) -> Optional[os.stat_result]:
+    """os.stat through the TTL cache; None when the path does not exist"""
+    key = abs_path(path)
+    now = time.monotonic()
+    hit = _stat_cache.get(key)
+    if hit is not None and now - hit[0] < STAT_TTL:
+        return hit[1]
+    try:
+        st = os.stat(key)
+    except FileNotFoundError:
+        st = None
+    if len(_stat_cache) >= 1024:
+        _stat_cache.clear()
+    _stat_cache[key] = (now, st)
+    return st
+
+def _forget(path: str) -> None:
+    """Drop a cached stat result after this server changes the path"""
+    _stat_cache.pop(abs_path(path), None)
+
+def _make_dirs(path: Path) -> None:
+    """mkdir(parents=True) that also forgets every directory it creates
+
+    Any of them may be cached as missing from a recent check.
+    """
+    created = []
+    for directory in (path, *path.parents):
+        if os.path.isdir(directory):
+            break
+        created.append(directory)
+    path.mkdir(parents=True, exist_ok=True)
+    for directory in created:
+        _forget(str(directory))
+
+# Files up to this size are cached by (path, mtime, size), so re-reading an
+# unchanged file skips the read and decode; larger files are always read fresh
+READ_CACHE_MAX_BYTES = 1024 * 1024
+
+def _decode(raw: bytes, final: bool = True) -> str:
+    # Binary read + one decode; newlines are normalised the way text mode would.
+    # With final=False an incomplete UTF-8 sequence at the end is dropped
+    text = codecs.getincrementaldecoder('utf-8')().decode(raw, final=final)
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+def _load_text(file_path: str) -> str:
+    with open(file_path, 'rb') as f:
+        return _decode(f.read())
+
+@lru_cache(maxsize=64)
+def _load_text_cached(file_path: str, mtime_ns: int, size: int) -> str:
+    # mtime_ns and size are part of the key only, so a changed file misses
+    return _load_text(file_path)
+
+def _read_file(file_path: str, max_bytes: Optional[int] = None) -> Dict[str, Any]:
+    """Read the contents of a file, or only its first max_bytes bytes"""
     try:
         path = Path(file_path)
-        if not path.exists():
+        st = _stat(file_path)
+        if st is None:
             return {"error": f"File not found: {file_path}"}
         
-        with open(path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        if max_bytes is not None and max_bytes < 0:
+            return {"error": f"max_bytes must not be negative: {max_bytes}"}
         
-        return {
+        truncated = max_bytes is not None and st.st_size > max_bytes
+        if truncated:
+            with open(path, 'rb') as f:
+                content = _decode(f.read(max_bytes), final=False)
+        elif st.st_size <= READ_CACHE_MAX_BYTES:
+            content = _load_text_cached(abs_path(file_path), st.st_mtime_ns, st.st_size)
+        else:
+            content = _load_text(path)
+        
+        result = {
             "success": True,
             "content": content,
-            "file_path": str(path.absolute())
+            "file_path": abs_path(file_path)
         }
+        if truncated:
+            result["truncated"] = True
+            result["size"] = st.st_size
+        return result
     except Exception as e:
         return {"error": f"Failed to read file: {str(e)}"}
 
-@mcp.tool()
-def write_file(file_path: str, content: str) -> Dict[str, Any]:
+def _write_file(file_path: str, content: str) -> Dict[str, Any]:
     """Write content to a file"""
     try:
         path = Path(file_path)
         
         # Create parent directories if they don't exist
-        path.parent.mkdir(parents=True, exist_ok=True)
+        _make_dirs(path.parent)
         
-        with open(path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        # Encode once and write the bytes in a single call
+        with open(path, 'wb') as f:
+            f.write(content.encode('utf-8'))
+        _forget(file_path)
+        _forget(str(path.parent))
         
         return {
             "success": True,
             "message": f"Successfully wrote to {file_path}",
-            "file_path": str(path.absolute())
+            "file_path": abs_path(file_path)
         }
     except Exception as e:
         return {"error": f"Failed to write file: {str(e)}"}
 
-@mcp.tool()
-def list_directory(directory_path: str = ".") -> Dict[str, Any]:
+def _list_directory(directory_path: str = ".") -> Dict[str, Any]:
     """List the contents of a directory"""
     try:
-        path = Path(directory_path)
-        if not path.exists():
+        st = _stat(directory_path)
+        if st is None:
             return {"error": f"Directory not found: {directory_path}"}
         
-        if not path.is_dir():
+        if not stat.S_ISDIR(st.st_mode):
             return {"error": f"Path is not a directory: {directory_path}"}
         
-        items = []
-        for item in path.iterdir():
-            items.append({
-                "name": item.name,
-                "type": "directory" if item.is_dir() else "file",
-                "path": str(item.absolute())
-            })
+        directory = abs_path(directory_path)
+        # scandir gets each entry's type from the directory read itself, so
+        # is_dir() needs no extra stat per entry (except for symlinks)
+        with os.scandir(directory) as it:
+            items = [
+                {
+                    "name": entry.name,
+                    "type": "directory" if entry.is_dir() else "file",
+                    "path": os.path.join(directory, entry.name)
+                }
+                for entry in it
+            ]
         
         return {
             "success": True,
-            "directory": str(path.absolute()),
+            "directory": directory,
             "items": items
         }
     except Exception as e:
         return {"error": f"Failed to list directory: {str(e)}"}
 
-@mcp.tool()
-def create_directory(directory_path: str) -> Dict[str, Any]:
+def _create_directory(directory_path: str) -> Dict[str, Any]:
     """Create a new directory"""
     try:
-        path = Path(directory_path)
-        path.mkdir(parents=True, exist_ok=True)
+        _make_dirs(Path(directory_path))
         
         return {
             "success": True,
             "message": f"Successfully created directory: {directory_path}",
-            "directory_path": str(path.absolute())
+            "directory_path": abs_path(directory_path)
         }
     except Exception as e:
         return {"error": f"Failed to create directory: {str(e)}"}
 
-@mcp.tool()
-def delete_file(file_path: str) -> Dict[str, Any]:
+def _delete_file(file_path: str) -> Dict[str, Any]:
     """Delete a file"""
     try:
         path = Path(file_path)
-        if not path.exists():
+        if _stat(file_path) is None:
             return {"error": f"File not found: {file_path}"}
         
         path.unlink()
+        _forget(file_path)
         
         return {
             "success": True,
@@ -113,6 +198,33 @@ def delete_file(file_path: str) -> Dict[str, Any]:
     except Exception as e:
         return {"error": f"Failed to delete file: {str(e)}"}
 
+# The tools are async and run the blocking calls above on worker threads,
+# so one slow read or write does not stall other requests on the event loop
+
+@mcp.tool()
+async def read_file(file_path: str, max_bytes: Optional[int] = None) -> Dict[str, Any]:
+    """Read the contents of a file (only the first max_bytes bytes if given)"""
+    return await asyncio.to_thread(_read_file, file_path, max_bytes)
+
+@mcp.tool()
+async def write_file(file_path: str, content: str) -> Dict[str, Any]:
+    """Write content to a file"""
+    return await asyncio.to_thread(_write_file, file_path, content)
+
+@mcp.tool()
+async def list_directory(directory_path: str = ".") -> Dict[str, Any]:
+    """List the contents of a directory"""
+    return await asyncio.to_thread(_list_directory, directory_path)
+
+@mcp.tool()
+async def create_directory(directory_path: str) -> Dict[str, Any]:
+    """Create a new directory"""
+    return await asyncio.to_thread(_create_directory, directory_path)
+
+@mcp.tool()
+async def delete_file(file_path: str) -> Dict[str, Any]:
+    """Delete a file"""
+    return await asyncio.to_thread(_delete_file, file_path)
 
 
 if __name__ == "__main__":
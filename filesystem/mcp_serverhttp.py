@@ -1,4 +1,5 @@
 
+import asyncio
 import os
 import subprocess
 from pathlib import Path
@@ -6,6 +7,8 @@ from fastmcp import FastMCP
 import sys 
 import logging
 
+from git_ops import abs_path, decode_output, run_git_async
+
 # Create the MCP server
 mcp = FastMCP("filesystem-git-server")
 
@@ -27,17 +30,35 @@ def read_file(file_path: str) -> str:
     except Exception as e:
         return f"Error reading file: {str(e)}"
 
+# Parent directories this process has already created or found present, so
+# repeated writes into the same directory skip makedirs' per-component stats
+_created_dirs = set()
+
+def _ensure_parent(dir_path: str) -> None:
+    if dir_path and dir_path not in _created_dirs:
+        os.makedirs(dir_path, exist_ok=True)
+        _created_dirs.add(dir_path)
+
 @mcp.tool()
 def write_file(file_path: str, content: str) -> str:
     """Write content to a file"""
     try:
         # Create directory if it doesn't exist
         dir_path = os.path.dirname(file_path)
-        if dir_path:
-            os.makedirs(dir_path, exist_ok=True)
+        _ensure_parent(dir_path)
         
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        # Encode once and hand the bytes straight to the buffered writer,
+        # skipping the text layer's chunked encode and newline translation
+        data = content.encode('utf-8')
+        try:
+            f = open(file_path, 'wb')
+        except FileNotFoundError:
+            # The directory was removed since it was cached; create it again
+            _created_dirs.discard(dir_path)
+            _ensure_parent(dir_path)
+            f = open(file_path, 'wb')
+        with f:
+            f.write(data)
         return f"Successfully wrote {len(content)} characters to '{file_path}'"
     except PermissionError:
         return f"Error: Permission denied to write to '{file_path}'"
@@ -52,11 +73,18 @@ def list_directory(directory_path: str = ".") -> str:
         if not path.exists():
             return f"Error: Directory '{directory_path}' does not exist"
         
+        # scandir reads entry types along with the names, so only regular files need a stat()
+        with os.scandir(directory_path) as it:
+            entries = sorted(it, key=lambda entry: os.path.normcase(entry.name))
+        
         items = []
-        for item in sorted(path.iterdir()):
-            item_type = "📁" if item.is_dir() else "📄"
-            size = f" ({item.stat().st_size} bytes)" if item.is_file() else ""
-            items.append(f"{item_type} {item.name}{size}")
+        for entry in entries:
+            if entry.is_dir():
+                items.append(f"📁 {entry.name}")
+            elif entry.is_file():
+                items.append(f"📄 {entry.name} ({entry.stat().st_size} bytes)")
+            else:
+                items.append(f"📄 {entry.name}")
         
         return f"Contents of '{directory_path}':\n" + "\n".join(items)
     except PermissionError:
@@ -92,37 +120,34 @@ def delete_file(file_path: str) -> str:
 # GIT TOOLS
 # =============================================================================
 
-def run_git_command(cmd, repo_path="."):
+# Absolute paths already confirmed to contain .git; only successes are remembered
+_known_repos = set()
+
+# Pushes go over the network and can legitimately take far longer than local commands
+PUSH_TIMEOUT = 120
+
+async def run_git_command(cmd, repo_path=".", timeout=10):
     """Run a git command safely (no pager, no prompts)."""
     try:
-        if not os.path.exists(os.path.join(repo_path, ".git")):
-            return False, f"Not a git repository: {repo_path}"
-
-        full_cmd = ["git", "--no-pager"] + cmd
-        env = os.environ.copy()
-        env["GIT_TERMINAL_PROMPT"] = "0"
-
-        result = subprocess.run(
-            full_cmd,
-            cwd=repo_path,
-            capture_output=True,
-            text=True,
-            timeout=10,
-            check=False,
-            env=env
-        )
+        repo = abs_path(repo_path)
+        if repo not in _known_repos:
+            if not os.path.exists(os.path.join(repo, ".git")):
+                return False, f"Not a git repository: {repo_path}"
+            _known_repos.add(repo)
+
+        result = await run_git_async(cmd, cwd=repo_path, timeout=timeout)
         if result.returncode == 0:
-            return True, result.stdout.strip()
-        return False, result.stderr.strip() or result.stdout.strip()
+            return True, decode_output(result.stdout)
+        return False, decode_output(result.stderr) or decode_output(result.stdout)
     except subprocess.TimeoutExpired:
         return False, "Git command timed out"
     except Exception as e:
         return False, f"Error: {e}"
 
 @mcp.tool()
-def git_init(repo_path: str = ".") -> str:
+async def git_init(repo_path: str = ".") -> str:
     """Initialize a new git repository"""
-    success, output = run_git_command(["init"], repo_path)
+    success, output = await run_git_command(["init"], repo_path)
     
     if not success:
         return f"Error initializing git repository: {output}"
@@ -130,16 +155,64 @@ def git_init(repo_path: str = ".") -> str:
     return f"Successfully initialized git repository in '{repo_path}'\n{output}"
 
 @mcp.tool()
-def git_status(repo_path: str = ".") -> str:
-    ok, out = run_git_command(["status", "--short", "--untracked-files=all"], repo_path)
+async def git_status(repo_path: str = ".") -> str:
+    ok, out = await run_git_command(["status", "--short", "--untracked-files=all"], repo_path)
     if not ok:
         return f"Error: {out}"
     return "Repository is clean" if not out else f"Git status:\n{out}"
 
+# Number of space-separated fields before the path in porcelain v2 entries
+_PORCELAIN_V2_FIELDS = {"1": 8, "2": 9, "u": 10}
+
 @mcp.tool()
-def git_log(repo_path: str = ".", limit: int = 10) -> str:
+async def git_session(repo_path: str = ".", log_limit: int = 0) -> str:
+    """Current branch, upstream and working tree status from a single git call
+
+    With log_limit > 0 the most recent commits are fetched as well; both git
+    processes run at the same time, since neither touches the index.
+    """
+    status = run_git_command(["status", "--porcelain=v2", "--branch", "--untracked-files=all"], repo_path)
+    if log_limit > 0:
+        log = run_git_command(["log", f"--max-count={log_limit}", "--oneline", "--decorate"], repo_path)
+        (success, output), (log_ok, log_output) = await asyncio.gather(status, log)
+    else:
+        success, output = await status
+    if not success:
+        return f"Error getting git session info: {output}"
+    
+    branch, upstream, ahead_behind = "(unknown)", None, None
+    changes = []
+    for line in output.splitlines():
+        kind = line[:1]
+        if line.startswith("# branch.head "):
+            branch = line[len("# branch.head "):]
+        elif line.startswith("# branch.upstream "):
+            upstream = line[len("# branch.upstream "):]
+        elif line.startswith("# branch.ab "):
+            ahead, behind = line[len("# branch.ab "):].split()
+            ahead_behind = f"ahead {ahead[1:]}, behind {behind[1:]}"
+        elif kind == "?":
+            changes.append(f"?? {line[2:]}")
+        elif kind in _PORCELAIN_V2_FIELDS:
+            fields = line.split(" ", _PORCELAIN_V2_FIELDS[kind])
+            xy = fields[1].replace(".", " ")
+            # Renames carry "<path>\t<original path>"
+            path = fields[-1].replace("\t", " <- ")
+            changes.append(f"{xy} {path}")
+    
+    header = f"Branch: {branch}"
+    if upstream:
+        header += f" (tracking {upstream}" + (f", {ahead_behind})" if ahead_behind else ")")
+    
+    report = f"{header}\nRepository is clean" if not changes else f"{header}\nChanges:\n" + "\n".join(changes)
+    if log_limit > 0:
+        report += f"\nRecent commits (last {log_limit}):\n{log_output}" if log_ok else f"\nError getting git log: {log_output}"
+    return report
+
+@mcp.tool()
+async def git_log(repo_path: str = ".", limit: int = 10) -> str:
     """Get the git commit history"""
-    success, output = run_git_command(["log", f"--max-count={limit}", "--oneline", "--decorate"], repo_path)
+    success, output = await run_git_command(["log", f"--max-count={limit}", "--oneline", "--decorate"], repo_path)
     
     if not success:
         return f"Error getting git log: {output}"
@@ -147,9 +220,9 @@ def git_log(repo_path: str = ".", limit: int = 10) -> str:
     return f"Recent commits (last {limit}):\n{output}"
 
 @mcp.tool()
-def git_branch(repo_path: str = ".") -> str:
+async def git_branch(repo_path: str = ".") -> str:
     """List git branches"""
-    success, output = run_git_command(["branch", "-v"], repo_path)
+    success, output = await run_git_command(["branch", "-v"], repo_path)
     
     if not success:
         return f"Error getting git branches: {output}"
@@ -157,26 +230,26 @@ def git_branch(repo_path: str = ".") -> str:
     return f"Git branches:\n{output}"
 
 @mcp.tool()
-def git_diff(repo_path: str = ".", file_path: str = "") -> str:
+async def git_diff(repo_path: str = ".", file_path: str = "") -> str:
     """Show git diff for changes"""
     cmd = ["diff"]
     if file_path:
         cmd.append(file_path)
     
-    success, output = run_git_command(cmd, repo_path)
+    success, output = await run_git_command(cmd, repo_path)
     
     if not success:
         return f"Error getting git diff: {output}"
     
-    if not output.strip():
+    if not output:
         return "No changes to show"
     
     return f"Git diff:\n{output}"
 
 @mcp.tool()
-def git_add(repo_path: str = ".", file_path: str = ".") -> str:
+async def git_add(repo_path: str = ".", file_path: str = ".") -> str:
     """Add files to git staging area"""
-    success, output = run_git_command(["add", file_path], repo_path)
+    success, output = await run_git_command(["add", file_path], repo_path)
     
     if not success:
         return f"Error adding files to git: {output}"
@@ -184,9 +257,9 @@ def git_add(repo_path: str = ".", file_path: str = ".") -> str:
     return f"Successfully added '{file_path}' to staging area"
 
 @mcp.tool()
-def git_commit(repo_path: str = ".", message: str = "Automated commit") -> str:
+async def git_commit(repo_path: str = ".", message: str = "Automated commit") -> str:
     """Commit staged changes"""
-    success, output = run_git_command(["commit", "-m", message], repo_path)
+    success, output = await run_git_command(["commit", "-m", message], repo_path)
     
     if not success:
         # Check if it's because there's nothing to commit
@@ -196,6 +269,31 @@ def git_commit(repo_path: str = ".", message: str = "Automated commit") -> str:
     
     return f"Successfully committed with message: '{message}'\n{output}"
 
+@mcp.tool()
+async def git_sync(repo_path: str = ".", message: str = "Automated commit", file_path: str = ".",
+                   remote: str = "origin", branch: str = "") -> str:
+    """Stage, commit and push in one call; stops at the first step that fails"""
+    push_cmd = ["push", remote] + ([branch] if branch else [])
+    steps = [
+        ("add", ["add", file_path], 10),
+        ("commit", ["commit", "-m", message], 10),
+        ("push", push_cmd, PUSH_TIMEOUT),
+    ]
+    
+    report = []
+    for step, cmd, timeout in steps:
+        success, output = await run_git_command(cmd, repo_path, timeout)
+        if not success:
+            if step == "commit" and "nothing to commit" in output.lower():
+                return "Nothing to commit - working tree clean"
+            report.append(f"[{step}] failed: {output}")
+            if step == "push":
+                report.append("The commit was created locally; only the push needs to be retried")
+            return "\n".join(report)
+        report.append(f"[{step}] ok" + (f"\n{output}" if output else ""))
+    
+    return "\n".join(report)
+
 @mcp.tool()
 def manual_git_commands(repo_path: str = ".") -> str:
     """Provide manual git commands to run in terminal"""
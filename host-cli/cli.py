@@ -1,27 +1,103 @@
 import os
 import sys
 import json
+import atexit
 import asyncio
+import threading
+from collections import OrderedDict
+from contextlib import AsyncExitStack
 from datetime import datetime
 from pathlib import Path
+from types import MappingProxyType
+import anyio
+import httpx
 from dotenv import load_dotenv
 from fastmcp import Client as FastMCPClient
 from colorama import Fore, Style, init
 import anthropic
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 init(autoreset=True)
 load_dotenv()
 
-client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+client = anthropic.AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+MODEL = "claude-sonnet-4-20250514"
+MAX_TOKENS = 500
+
+# Tool results are parsed and re-serialized on every tool call; orjson's C
+# codec is used for that when it is installed, the json module otherwise.
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers catch the latter
+def _loads(text: str):
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+def _dumps(obj) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj)
 
 # =========================
 # Chat Log Manager
 # =========================
 class ChatLogManager:
+    """Chat sessions on disk.
+
+    Each session is two files: <name>.meta.json holds the session metadata and
+    <name>.jsonl holds the history, one message per line. Appending a message
+    writes a single line to the already-open history file instead of
+    rewriting the whole session. Sessions saved as a single <name>.json by
+    older versions are still listed, and are converted when loaded.
+    """
     def __init__(self, logs_directory="chat_logs"):
         self.logs_dir = Path(logs_directory)
         self.logs_dir.mkdir(exist_ok=True)
         self.current_session_file = None
+        self._session_data = None  # In-memory copy of the current session
+        self._history_fp = None    # Open append handle for the current history file
+        self._meta_stale = False   # Messages appended since the metadata was last written
+        atexit.register(self.close)
+    
+    def _meta_file(self, session_name):
+        return self.logs_dir / f"{session_name}.meta.json"
+    
+    def _history_file(self, session_name):
+        return self.logs_dir / f"{session_name}.jsonl"
+    
+    def _legacy_file(self, session_name):
+        return self.logs_dir / f"{session_name}.json"
+    
+    def _write_meta(self, session_data):
+        meta = {key: value for key, value in session_data.items() if key != "history"}
+        # Serialize first, then write once: no per-token writes through the text
+        # layer, and a serialization error cannot leave a truncated file behind
+        data = json.dumps(meta, indent=2, ensure_ascii=False)
+        with open(self.current_session_file, 'w', encoding='utf-8') as f:
+            f.write(data)
+        self._meta_stale = False
+    
+    def _open_history(self, session_name, mode):
+        self._history_fp = open(self._history_file(session_name), mode, encoding='utf-8', buffering=65536)
+    
+    def flush(self):
+        """Write buffered history lines to disk, then the metadata they changed.
+
+        Keeps last_updated and message_count on disk in step with the history,
+        so /session list is accurate even after a crash.
+        """
+        if self._history_fp is not None:
+            self._history_fp.flush()
+            if self._meta_stale:
+                self._write_meta(self._session_data)
+    
+    def close(self):
+        """Close the current session's history file and record its final metadata."""
+        if self._history_fp is not None:
+            self._history_fp.close()
+            self._history_fp = None
+            self._write_meta(self._session_data)
         
     def create_new_session(self, session_name=None):
         """Create a new chat session file."""
@@ -29,47 +105,87 @@ class ChatLogManager:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             session_name = f"chat_{timestamp}"
         
-        self.current_session_file = self.logs_dir / f"{session_name}.json"
+        self.close()
+        self.current_session_file = self._meta_file(session_name)
         
         # Initialize with metadata
+        now_iso = datetime.now().isoformat()
         session_data = {
             "session_name": session_name,
-            "created_at": datetime.now().isoformat(),
-            "last_updated": datetime.now().isoformat(),
+            "created_at": now_iso,
+            "last_updated": now_iso,
             "message_count": 0,
             "history": []
         }
         
-        self.save_session_data(session_data)
+        self._session_data = session_data
+        self.save_session_data(session_data, now_iso)
+        self._open_history(session_name, 'w')
         return session_name
     
+    def _read_session(self, session_name):
+        """Read a session from disk without making it the current one."""
+        meta_file = self._meta_file(session_name)
+        if meta_file.exists():
+            with open(meta_file, 'r', encoding='utf-8') as f:
+                session_data = json.load(f)
+            history = []
+            history_file = self._history_file(session_name)
+            if history_file.exists():
+                with open(history_file, 'r', encoding='utf-8') as f:
+                    history = [json.loads(line) for line in f if line.strip()]
+            session_data["history"] = history
+            session_data["message_count"] = len(history)
+            return session_data
+        
+        legacy_file = self._legacy_file(session_name)
+        if legacy_file.exists():
+            with open(legacy_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        
+        raise FileNotFoundError(f"Session {session_name} not found")
+    
     def load_session(self, session_name):
         """Load an existing chat session."""
-        session_file = self.logs_dir / f"{session_name}.json"
-        if not session_file.exists():
-            raise FileNotFoundError(f"Session {session_name} not found")
+        # Bring the active session's files up to date first, so reloading it
+        # reads its latest state rather than the last metadata written
+        if self._history_fp is not None:
+            self._history_fp.flush()
+            self._write_meta(self._session_data)
+        session_data = self._read_session(session_name)
         
-        self.current_session_file = session_file
-        with open(session_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        self.close()
+        self.current_session_file = self._meta_file(session_name)
+        self._session_data = session_data
+        
+        if not self.current_session_file.exists():
+            # Single-file session from an older version: split it on first load
+            self._open_history(session_name, 'w')
+            self._history_fp.write("".join(
+                json.dumps(message, ensure_ascii=False) + "\n" for message in session_data["history"]
+            ))
+            self._history_fp.flush()
+            self.save_session_data(session_data)
+            self._legacy_file(session_name).unlink()
+        else:
+            self._open_history(session_name, 'a')
+        return self._session_data
     
-    def save_session_data(self, session_data):
-        """Save session data to current session file."""
+    def save_session_data(self, session_data, now_iso=None):
+        """Save session metadata to the current session's metadata file."""
         if not self.current_session_file:
             raise ValueError("No active session")
         
-        session_data["last_updated"] = datetime.now().isoformat()
+        session_data["last_updated"] = now_iso or datetime.now().isoformat()
         session_data["message_count"] = len(session_data["history"])
-        
-        with open(self.current_session_file, 'w', encoding='utf-8') as f:
-            json.dump(session_data, f, indent=2, ensure_ascii=False)
+        self._write_meta(session_data)
     
     def append_message(self, role, content, metadata=None):
         """Append a message to the current session."""
         if not self.current_session_file:
             raise ValueError("No active session")
         
-        # Load current data
+        # Work on the in-memory copy instead of re-reading the file every turn
         session_data = self.load_current_session()
         
         message = {
@@ -81,192 +197,402 @@ class ChatLogManager:
         if metadata:
             message["metadata"] = metadata
         
+        # One line per message into the buffered file; main() calls flush()
+        # once per turn, so a turn's messages reach the disk in one write and
+        # a crash loses at most the current turn
+        self._history_fp.write(json.dumps(message, ensure_ascii=False) + "\n")
+        
         session_data["history"].append(message)
-        self.save_session_data(session_data)
+        session_data["last_updated"] = message["timestamp"]
+        session_data["message_count"] = len(session_data["history"])
+        self._meta_stale = True
     
     def load_current_session(self):
         """Load current session data."""
-        if not self.current_session_file or not self.current_session_file.exists():
-            raise ValueError("No active session or session file missing")
-        
-        with open(self.current_session_file, 'r', encoding='utf-8') as f:
+        if self._session_data is None:
+            raise ValueError("No active session")
+        return self._session_data
+    
+    @staticmethod
+    def _read_legacy_meta(file_path):
+        """Metadata of an old single-file session without parsing its history.
+
+        Those files were written with the metadata keys before "history", so
+        only the part in front of that key is parsed; anything unexpected
+        falls back to parsing the whole file.
+        """
+        with open(file_path, 'r', encoding='utf-8') as f:
+            head = f.read(4096)
+            if not head.lstrip().startswith('{'):
+                # Empty or not a JSON object: not a session, skip the parse
+                return None
+            marker = head.find('"history"')
+            if marker != -1:
+                try:
+                    return json.loads(head[:marker].rstrip().rstrip(',') + '}')
+                except json.JSONDecodeError:
+                    pass
+            f.seek(0)
             return json.load(f)
     
     def list_sessions(self):
         """List all available chat sessions."""
         sessions = []
         for file_path in self.logs_dir.glob("*.json"):
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    sessions.append({
-                        "name": data.get("session_name", file_path.stem),
-                        "created_at": data.get("created_at", "Unknown"),
-                        "last_updated": data.get("last_updated", "Unknown"),
-                        "message_count": data.get("message_count", 0),
-                        "file": file_path.name
-                    })
-            except (json.JSONDecodeError, KeyError):
-                # Skip invalid files
-                continue
+            # Only metadata is read; histories live in the .jsonl files
+            is_meta = file_path.name.endswith(".meta.json")
+            if file_path == self.current_session_file:
+                data = self._session_data
+            else:
+                try:
+                    if is_meta:
+                        with open(file_path, 'r', encoding='utf-8') as f:
+                            data = json.load(f)
+                    else:
+                        data = self._read_legacy_meta(file_path)
+                except (json.JSONDecodeError, KeyError, UnicodeDecodeError):
+                    # Skip invalid files
+                    continue
+                if not isinstance(data, dict):
+                    continue
+            
+            default_name = file_path.name[:-len(".meta.json")] if is_meta else file_path.stem
+            sessions.append({
+                "name": data.get("session_name", default_name),
+                "created_at": data.get("created_at", "Unknown"),
+                "last_updated": data.get("last_updated", "Unknown"),
+                "message_count": data.get("message_count", 0),
+                "file": file_path.name
+            })
         
         return sorted(sessions, key=lambda x: x["last_updated"], reverse=True)
     
     def delete_session(self, session_name):
         """Delete a chat session."""
-        session_file = self.logs_dir / f"{session_name}.json"
-        if session_file.exists():
-            session_file.unlink()
-            return True
-        return False
+        if self.current_session_file == self._meta_file(session_name):
+            # Close without writing the metadata back; the files are going away
+            if self._history_fp is not None:
+                self._history_fp.close()
+                self._history_fp = None
+            self.current_session_file = None
+            self._session_data = None
+        
+        session_files = [
+            self._meta_file(session_name),
+            self._history_file(session_name),
+            self._legacy_file(session_name)
+        ]
+        deleted = False
+        for session_file in session_files:
+            if session_file.exists():
+                session_file.unlink()
+                deleted = True
+        return deleted
     
     def export_session(self, session_name, format="txt"):
         """Export session to different formats."""
-        session_data = self.load_session(session_name)
+        session_data = self._read_session(session_name)
         
         if format == "txt":
             output_file = self.logs_dir / f"{session_name}.txt"
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(f"Chat Session: {session_data['session_name']}\n")
-                f.write(f"Created: {session_data['created_at']}\n")
-                f.write(f"Messages: {session_data['message_count']}\n")
-                f.write("=" * 50 + "\n\n")
+            parts = [
+                f"Chat Session: {session_data['session_name']}\n",
+                f"Created: {session_data['created_at']}\n",
+                f"Messages: {session_data['message_count']}\n",
+                "=" * 50 + "\n\n"
+            ]
+            
+            for msg in session_data['history']:
+                timestamp = msg.get('timestamp', '')
+                role = msg['role'].upper()
+                content = msg['content']
                 
-                for msg in session_data['history']:
-                    timestamp = msg.get('timestamp', '')
-                    role = msg['role'].upper()
-                    content = msg['content']
-                    
-                    if isinstance(content, list):
-                        # Handle complex content (tool calls, etc.)
-                        content_str = json.dumps(content, indent=2)
-                    else:
-                        content_str = str(content)
-                    
-                    f.write(f"[{timestamp}] {role}: {content_str}\n\n")
+                if isinstance(content, list):
+                    # Handle complex content (tool calls, etc.)
+                    content_str = json.dumps(content, indent=2)
+                else:
+                    content_str = str(content)
+                
+                parts.append(f"[{timestamp}] {role}: {content_str}\n\n")
+            
+            # Assemble the whole export and write it in one call
+            with open(output_file, 'w', encoding='utf-8') as f:
+                f.write("".join(parts))
         
         return output_file
 
 # =========================
 # MCP Manager
 # =========================
+# Schemas advertised to Claude in place of the servers' own, for tools where
+# Claude tends to use different parameter names (tool name -> input schema)
+_SCHEMA_MODIFICATIONS = MappingProxyType({
+    # Flight booking tools - add common parameters Claude might use
+    'search_cheapest_flights': {
+        'type': 'object',
+        'properties': {
+            'origin': {'type': 'string', 'description': 'Origin airport code'},
+            'destination': {'type': 'string', 'description': 'Destination airport code'},
+            'limit': {'type': 'integer', 'description': 'Number of results', 'default': 10},
+            'max_stops': {'type': 'integer', 'description': 'Maximum stops', 'default': 2}
+        }
+    },
+    'search_flights': {
+        'type': 'object', 
+        'properties': {
+            'origin': {'type': 'string', 'description': 'Origin city'},
+            'destination': {'type': 'string', 'description': 'Destination city'},
+            'from_city': {'type': 'string', 'description': 'From city'},
+            'to_city': {'type': 'string', 'description': 'To city'},
+            'limit': {'type': 'integer', 'description': 'Number of results', 'default': 10},
+            'max_price': {'type': 'number', 'description': 'Maximum price', 'default': 0},
+            'min_price': {'type': 'number', 'description': 'Minimum price', 'default': 0},
+            'airline': {'type': 'string', 'description': 'Airline filter', 'default': ''},
+            'class_type': {'type': 'string', 'description': 'Class type filter', 'default': ''},
+            'max_stops': {'type': 'integer', 'description': 'Maximum stops', 'default': -1}
+        }
+    },
+    # Git tools - Claude expects 'directory' parameter
+    'git_init': {
+        'type': 'object',
+        'properties': {
+            'directory': {'type': 'string', 'description': 'Directory to initialize git repo in', 'default': '.'}
+        }
+    },
+    'git_add': {
+        'type': 'object',
+        'properties': {
+            'directory': {'type': 'string', 'description': 'Repository directory', 'default': '.'},
+            'file_path': {'type': 'string', 'description': 'File to add', 'default': '.'}
+        }
+    },
+    'git_commit': {
+        'type': 'object',
+        'properties': {
+            'directory': {'type': 'string', 'description': 'Repository directory', 'default': '.'},
+            'message': {'type': 'string', 'description': 'Commit message', 'default': 'Automated commit'}
+        }
+    },
+    'git_status': {
+        'type': 'object',
+        'properties': {
+            'directory': {'type': 'string', 'description': 'Repository directory', 'default': '.'}
+        }
+    },
+    # File operations - Claude expects 'path' parameter
+    'create_directory': {
+        'type': 'object',
+        'properties': {
+            'path': {'type': 'string', 'description': 'Directory path to create'}
+        }
+    },
+    'read_file': {
+        'type': 'object',
+        'properties': {
+            'path': {'type': 'string', 'description': 'File path to read'}
+        }
+    },
+    'write_file': {
+        'type': 'object',
+        'properties': {
+            'path': {'type': 'string', 'description': 'File path to write'},
+            'content': {'type': 'string', 'description': 'Content to write'}
+        }
+    },
+    'list_directory': {
+        'type': 'object',
+        'properties': {
+            'path': {'type': 'string', 'description': 'Directory path to list', 'default': '.'}
+        }
+    }
+})
+
+# Claude-side parameter names -> the names the MCP servers expect (per tool)
+_PARAMETER_MAPPINGS = MappingProxyType({
+    # File operations
+    'create_directory': {'path': 'directory_path'},
+    'write_file': {'path': 'file_path'},
+    'read_file': {'path': 'file_path'},
+    'delete_file': {'path': 'file_path'},
+    'list_directory': {'path': 'directory_path'},
+    
+    # Git commands - map Claude's 'directory' to server's 'repo_path'
+    'git_init': {'directory': 'repo_path'},
+    'git_add': {'directory': 'repo_path'},
+    'git_commit': {'directory': 'repo_path'},
+    'git_status': {'directory': 'repo_path'},
+    'git_log': {'directory': 'repo_path'},
+    'git_branch': {'directory': 'repo_path'},
+    'git_diff': {'directory': 'repo_path'},
+    
+    # Flight search - map common parameters
+    'search_cheapest_flights': {
+        'origin': 'from_city',
+        'destination': 'to_city'
+    },
+    'search_flights': {
+        'origin': 'from_city', 
+        'destination': 'to_city'
+    }
+})
+
+def _build_remapper(mapping: dict):
+    """Parameter renamer for one tool; a None target drops the parameter."""
+    def remap(params: dict) -> dict:
+        mapped_params = {}
+        for key, value in params.items():
+            # Use mapped parameter name if it exists, otherwise use original
+            mapped_key = mapping.get(key, key)
+            if mapped_key is not None:  # Only add if mapping isn't explicitly None
+                mapped_params[mapped_key] = value
+        return mapped_params
+    return remap
+
+# Built once at import; tools without an entry pass their parameters through
+_REMAPPERS = MappingProxyType({name: _build_remapper(mapping) for name, mapping in _PARAMETER_MAPPINGS.items()})
+
+# Errors meaning the connection to a server is gone rather than the tool failing;
+# call_tool reconnects on these. Most can surface after the server already ran
+# the tool, so only read-only tools (CACHEABLE_TOOLS) are retried on any of
+# them; other tools are retried only when the connection could not be opened
+# at all (UNSENT_ERRORS). Up to CALL_ATTEMPTS tries in total
+CONNECTION_ERRORS = (httpx.TransportError, anyio.ClosedResourceError, anyio.BrokenResourceError)
+UNSENT_ERRORS = (httpx.ConnectError,)
+CALL_ATTEMPTS = 3
+
+# Marks the end of a request prefix that stays the same from turn to turn,
+# so the API reads it from the prompt cache at the reduced input rate
+CACHE_CONTROL = {"type": "ephemeral"}
+
+# Read-only tools whose results are reused for identical arguments, so a
+# repeated call within one turn (Claude re-reading a file or retrying a search)
+# skips the round trip. main() clears the cache on every new prompt, since the
+# user may have changed files in between, and a call to any other tool (a write,
+# commit, ...) clears it too since it may change what they see. Results that
+# report an error are not cached
+CACHEABLE_TOOLS = frozenset({
+    "read_file", "list_directory",
+    "git_status", "git_log", "git_branch", "git_diff",
+    "search_flights", "search_by_route", "search_cheapest_flights",
+})
+TOOL_CACHE_SIZE = 128
+
+def _is_error_result(result) -> bool:
+    """Whether a tool result reports a failure.
+
+    Besides MCP's isError flag, the servers report failures in the result
+    itself: as an {"error": ...} object (mcp_server.py) or as text starting
+    with "Error" / "Git error" (the git and flight tools).
+    """
+    if getattr(result, "is_error", False):
+        return True
+    data = getattr(result, "structured_content", None)
+    if isinstance(data, dict) and "error" in data:
+        return True
+    content = getattr(result, "content", None)
+    if content and hasattr(content[0], "text"):
+        text = content[0].text.lstrip()
+        if text.startswith(("Error", "Git error")):
+            return True
+        return text[:1] == "{" and text[1:].lstrip().startswith('"error"')
+    return False
+
 class MCPManager:
     def __init__(self):
-        self.servers = {}   # {alias: {"url": str}}
+        self.servers = {}   # {alias: {"url": str, "lock": asyncio.Lock, "client": FastMCPClient, "stack": AsyncExitStack}}
         self.tools = []     # merged tools with server alias
+        self._claude_tools = None  # get_tools_for_claude() result, reset by add_server
+        self._claude_names = {}    # Claude tool name -> (server alias, tool name)
+        self._cache = OrderedDict()  # (alias, tool, params JSON) -> result, LRU order
+        self._cache_generation = 0   # Bumped by clear_tool_cache()
+
+    async def _connect(self, alias: str):
+        """Open the connection to a registered server and keep it open.
+
+        Tool calls reuse the running stdio subprocess / HTTP session until
+        _disconnect() or aclose().
+        """
+        server = self.servers[alias]
+        stack = AsyncExitStack()
+        client = FastMCPClient(server["url"])   # no transport arg
+        await stack.enter_async_context(client)
+        server["client"], server["stack"] = client, stack
+        return client
+
+    async def _get_client(self, alias: str):
+        """The server's open client, connecting first if there is none.
+
+        Concurrent tool calls share the server's lock here, so a dropped
+        connection is reopened once rather than once per waiting call.
+        """
+        server = self.servers[alias]
+        async with server["lock"]:
+            if "client" not in server:
+                await self._connect(alias)
+            return server["client"]
+
+    async def _drop_client(self, alias: str, client):
+        """Close a client that failed, unless another call already replaced it."""
+        server = self.servers[alias]
+        async with server["lock"]:
+            if server.get("client") is client:
+                await self._disconnect(alias)
+
+    async def _disconnect(self, alias: str):
+        server = self.servers[alias]
+        server.pop("client", None)
+        stack = server.pop("stack", None)
+        if stack is not None:
+            try:
+                await stack.aclose()
+            except Exception:
+                # The connection may already be broken; nothing left to clean up
+                pass
 
     async def add_server(self, alias: str, target: str):
         """Register an MCP server (auto-detect http or stdio)."""
-        self.servers[alias] = {"url": target}
-        client = FastMCPClient(target)   # no transport arg
-        async with client:
+        self.servers[alias] = {"url": target, "lock": asyncio.Lock()}
+        client = await self._connect(alias)
+        try:
             tools = await client.list_tools()
-            for t in tools:
+        except BaseException:
+            await self._disconnect(alias)
+            raise
+        
+        new_tools = [
+            {
+                "server": alias,
+                "name": t.name,
+                "description": t.description,
                 # Modify the schema to match what Claude expects
-                modified_schema = self._modify_tool_schema(t.name, getattr(t, "input_schema", {"type": "object"}))
-                
-                self.tools.append({
-                    "server": alias,
-                    "name": t.name,
-                    "description": t.description,
-                    "input_schema": modified_schema  # Use modified schema
-                })
+                "input_schema": self._modify_tool_schema(t.name, getattr(t, "input_schema", {"type": "object"})),
+                # Use underscore instead of double colon to comply with Claude's naming pattern
+                "claude_name": f"{alias}_{t.name}",
+                "claude_description": f"[{alias}] {t.description}"  # Add server context to description
+            }
+            for t in tools
+        ]
+        # Servers are registered concurrently, so each one's tools are added in one step
+        self.tools.extend(new_tools)
+        for tool in new_tools:
+            self._claude_names[tool["claude_name"]] = (alias, tool["name"])
+        self._claude_tools = None
 
     def _modify_tool_schema(self, tool_name: str, original_schema: dict) -> dict:
         """Modify tool schemas to match what Claude expects to send."""
-        
-        # Define schema modifications for specific tools
-        schema_modifications = {
-            # Flight booking tools - add common parameters Claude might use
-            'search_cheapest_flights': {
-                'type': 'object',
-                'properties': {
-                    'origin': {'type': 'string', 'description': 'Origin airport code'},
-                    'destination': {'type': 'string', 'description': 'Destination airport code'},
-                    'limit': {'type': 'integer', 'description': 'Number of results', 'default': 10},
-                    'max_stops': {'type': 'integer', 'description': 'Maximum stops', 'default': 2}
-                }
-            },
-            'search_flights': {
-                'type': 'object', 
-                'properties': {
-                    'origin': {'type': 'string', 'description': 'Origin city'},
-                    'destination': {'type': 'string', 'description': 'Destination city'},
-                    'from_city': {'type': 'string', 'description': 'From city'},
-                    'to_city': {'type': 'string', 'description': 'To city'},
-                    'limit': {'type': 'integer', 'description': 'Number of results', 'default': 10},
-                    'max_price': {'type': 'number', 'description': 'Maximum price', 'default': 0},
-                    'min_price': {'type': 'number', 'description': 'Minimum price', 'default': 0},
-                    'airline': {'type': 'string', 'description': 'Airline filter', 'default': ''},
-                    'class_type': {'type': 'string', 'description': 'Class type filter', 'default': ''},
-                    'max_stops': {'type': 'integer', 'description': 'Maximum stops', 'default': -1}
-                }
-            },
-            # Git tools - Claude expects 'directory' parameter
-            'git_init': {
-                'type': 'object',
-                'properties': {
-                    'directory': {'type': 'string', 'description': 'Directory to initialize git repo in', 'default': '.'}
-                }
-            },
-            'git_add': {
-                'type': 'object',
-                'properties': {
-                    'directory': {'type': 'string', 'description': 'Repository directory', 'default': '.'},
-                    'file_path': {'type': 'string', 'description': 'File to add', 'default': '.'}
-                }
-            },
-            'git_commit': {
-                'type': 'object',
-                'properties': {
-                    'directory': {'type': 'string', 'description': 'Repository directory', 'default': '.'},
-                    'message': {'type': 'string', 'description': 'Commit message', 'default': 'Automated commit'}
-                }
-            },
-            'git_status': {
-                'type': 'object',
-                'properties': {
-                    'directory': {'type': 'string', 'description': 'Repository directory', 'default': '.'}
-                }
-            },
-            # File operations - Claude expects 'path' parameter
-            'create_directory': {
-                'type': 'object',
-                'properties': {
-                    'path': {'type': 'string', 'description': 'Directory path to create'}
-                }
-            },
-            'read_file': {
-                'type': 'object',
-                'properties': {
-                    'path': {'type': 'string', 'description': 'File path to read'}
-                }
-            },
-            'write_file': {
-                'type': 'object',
-                'properties': {
-                    'path': {'type': 'string', 'description': 'File path to write'},
-                    'content': {'type': 'string', 'description': 'Content to write'}
-                }
-            },
-            'list_directory': {
-                'type': 'object',
-                'properties': {
-                    'path': {'type': 'string', 'description': 'Directory path to list', 'default': '.'}
-                }
-            }
-        }
-        
-        return schema_modifications.get(tool_name, original_schema)
+        return _SCHEMA_MODIFICATIONS.get(tool_name, original_schema)
 
     def debug_tool_schemas(self):
         """Print all tool schemas for debugging."""
-        print(Fore.CYAN + "\n=== DEBUGGING TOOL SCHEMAS ===")
+        # Built as one string and printed once: colorama on Windows converts
+        # every separate write, which made this dump slow with many tools
+        lines = [Fore.CYAN + "\n=== DEBUGGING TOOL SCHEMAS ==="]
         for tool in self.tools:
-            print(f"\n{Fore.YELLOW}=== {tool['server']}_{tool['name']} ===")
-            print(f"{Fore.WHITE}Description: {tool['description']}")
-            print(f"{Fore.MAGENTA}Schema: {json.dumps(tool['input_schema'], indent=2)}")
-        print(Fore.CYAN + "\n=== END SCHEMAS DEBUG ===\n")
+            lines.append(f"\n{Fore.YELLOW}=== {tool['claude_name']} ===")
+            lines.append(f"{Fore.WHITE}Description: {tool['description']}")
+            lines.append(f"{Fore.MAGENTA}Schema: {json.dumps(tool['input_schema'], indent=2)}")
+        lines.append(Fore.CYAN + "\n=== END SCHEMAS DEBUG ===\n")
+        print("\n".join(lines))
 
     async def call_tool(self, server_alias: str, tool_name: str, params: dict):
         """Route a tool call to the correct MCP server."""
@@ -277,73 +603,82 @@ class MCPManager:
         # Apply parameter mapping if needed
         mapped_params = self._map_parameters(tool_name, params)
         
-        client = FastMCPClient(server["url"])  # auto-detect again
-        async with client:
-            return await client.call_tool(tool_name, mapped_params)
+        if tool_name not in CACHEABLE_TOOLS:
+            self.clear_tool_cache()
+            try:
+                return await self._call(server_alias, tool_name, mapped_params)
+            finally:
+                # Reads that ran alongside this call may have stored results
+                # from before its changes
+                self.clear_tool_cache()
         
-    def _map_parameters(self, tool_name: str, params: dict) -> dict:
-        """Map parameters to match MCP server expectations."""
-        # Define parameter mappings for specific tools
-        parameter_mappings = {
-            # File operations
-            'create_directory': {'path': 'directory_path'},
-            'write_file': {'path': 'file_path'},
-            'read_file': {'path': 'file_path'},
-            'delete_file': {'path': 'file_path'},
-            'list_directory': {'path': 'directory_path'},
-            
-            # Git commands - map Claude's 'directory' to server's 'repo_path'
-            'git_init': {'directory': 'repo_path'},
-            'git_add': {'directory': 'repo_path'},
-            'git_commit': {'directory': 'repo_path'},
-            'git_status': {'directory': 'repo_path'},
-            'git_log': {'directory': 'repo_path'},
-            'git_branch': {'directory': 'repo_path'},
-            'git_diff': {'directory': 'repo_path'},
-            
-            # Flight search - map common parameters
-            'search_cheapest_flights': {
-                'origin': 'from_city',
-                'destination': 'to_city'
-            },
-            'search_flights': {
-                'origin': 'from_city', 
-                'destination': 'to_city'
-            }
-        }
+        key = (server_alias, tool_name, json.dumps(mapped_params, sort_keys=True, default=str))
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
         
-        mapping = parameter_mappings.get(tool_name, {})
-        mapped_params = {}
+        generation = self._cache_generation
+        result = await self._call(server_alias, tool_name, mapped_params)
+        # Not stored if another tool call started or finished meanwhile: the
+        # result may predate what that call changed
+        if generation == self._cache_generation and not _is_error_result(result):
+            self._cache[key] = result
+            if len(self._cache) > TOOL_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return result
+
+    def clear_tool_cache(self):
+        """Forget all cached tool results, e.g. before a new prompt."""
+        self._cache.clear()
+        self._cache_generation += 1
+
+    async def _call(self, server_alias: str, tool_name: str, mapped_params: dict):
+        """Call the tool, reconnecting and retrying on connection errors."""
+        for attempt in range(CALL_ATTEMPTS):
+            client = await self._get_client(server_alias)
+            try:
+                result = await client.call_tool(tool_name, mapped_params)
+            except CONNECTION_ERRORS as e:
+                # The connection dropped (typically the remote HTTP session);
+                # the next call opens a fresh one. A tool with side effects
+                # is not run again unless the request never went out
+                await self._drop_client(server_alias, client)
+                if attempt == CALL_ATTEMPTS - 1 or not (tool_name in CACHEABLE_TOOLS or isinstance(e, UNSENT_ERRORS)):
+                    raise
+                continue
+            return result
+
+    async def aclose(self):
+        """Close all server connections."""
+        for alias in list(self.servers):
+            await self._disconnect(alias)
         
-        for key, value in params.items():
-            # Use mapped parameter name if it exists, otherwise use original
-            mapped_key = mapping.get(key, key)
-            if mapped_key is not None:  # Only add if mapping isn't explicitly None
-                mapped_params[mapped_key] = value
-            
-        return mapped_params
+    def _map_parameters(self, tool_name: str, params: dict) -> dict:
+        """Map parameters to match MCP server expectations."""
+        remap = _REMAPPERS.get(tool_name)
+        return remap(params) if remap is not None else params
 
     def get_tools_for_claude(self):
         """Format tools into Claude's schema with server prefix."""
-        tools_for_claude = []
-        for t in self.tools:
-            # Use underscore instead of double colon to comply with Claude's naming pattern
-            claude_tool_name = f"{t['server']}_{t['name']}"
-            tools_for_claude.append({
-                "name": claude_tool_name,
-                "description": f"[{t['server']}] {t['description']}",  # Add server context to description
-                "input_schema": t["input_schema"]
-            })
-        return tools_for_claude
+        if self._claude_tools is not None:
+            return self._claude_tools
+        
+        self._claude_tools = [
+            {"name": t["claude_name"], "description": t["claude_description"], "input_schema": t["input_schema"]}
+            for t in self.tools
+        ]
+        if self._claude_tools:
+            # Tools come first in every request and never change, so they are
+            # the prompt-cache prefix
+            self._claude_tools[-1]["cache_control"] = CACHE_CONTROL
+        return self._claude_tools
 
     def parse_tool_name(self, claude_tool_name: str):
         """Parse Claude tool name back to server alias and original tool name."""
-        # Find the first underscore to split server alias from tool name
-        parts = claude_tool_name.split('_', 1)
-        if len(parts) == 2:
-            return parts[0], parts[1]
+        # Names are registered in add_server, so aliases and tool names that
+        # contain underscores themselves still resolve to the right pair.
         # Fallback: assume it's just the tool name with no server prefix
-        return None, claude_tool_name
+        return self._claude_names.get(claude_tool_name, (None, claude_tool_name))
 
 # =========================
 # CLI Helpers
@@ -366,6 +701,30 @@ def print_tool_result(result):
 def print_session_info(session_name, message_count):
     print(Fore.CYAN + f"[SESSION: {session_name}] Messages: {message_count}")
 
+async def async_input(prompt: str) -> str:
+    """input() that keeps the event loop running while waiting for the user.
+
+    The read happens on a daemon thread rather than the default executor, so
+    Ctrl+C can still end the program while the prompt is waiting.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def deliver(setter, value):
+        if not future.done():
+            setter(value)
+
+    def read_line():
+        try:
+            line = input(prompt)
+        except BaseException as e:
+            loop.call_soon_threadsafe(deliver, future.set_exception, e)
+        else:
+            loop.call_soon_threadsafe(deliver, future.set_result, line)
+
+    threading.Thread(target=read_line, daemon=True).start()
+    return await future
+
 # =========================
 # Session Management Commands
 # =========================
@@ -435,25 +794,265 @@ def handle_session_commands(command_parts, log_manager):
         print_error(f"Session command failed: {e}")
         return False
 
+# =========================
+# Tool Execution
+# =========================
+async def execute_tool_use(manager, part):
+    """Run one tool_use block from Claude on its MCP server.
+
+    Returns the tool_result block for the next request, or None when the tool
+    name does not belong to any registered server.
+    """
+    # Parse server alias and tool name from Claude's tool name
+    server_alias, tool_name = manager.parse_tool_name(part.name)
+    params = part.input
+
+    print_function_call(part.name, params)
+
+    if not server_alias:
+        print_error(f"Could not parse server alias from tool name: {part.name}")
+        return None
+
+    raw_result = await manager.call_tool(server_alias, tool_name, params)
+    
+    # Extract the actual result from the CallToolResult object
+    if hasattr(raw_result, 'content') and raw_result.content:
+        # Get the first content item (usually TextContent)
+        first_content = raw_result.content[0]
+        if hasattr(first_content, 'text'):
+            text = first_content.text
+            if text[:1] in ("{", "["):
+                # A JSON object or array (the usual reply, and possibly a large
+                # flight search) goes to Claude verbatim: parsing it only to
+                # dump it again would walk and copy the whole payload twice
+                print_tool_result(text)
+                return {"type": "tool_result", "tool_use_id": part.id, "content": text}
+            try:
+                # Try to parse as JSON first
+                tool_result = _loads(text)
+            except json.JSONDecodeError:
+                # If not JSON, use as plain text
+                tool_result = {"response": text}
+        else:
+            tool_result = {"response": str(first_content)}
+    elif hasattr(raw_result, 'data') and raw_result.data:
+        # Use the structured data if available
+        tool_result = raw_result.data
+    else:
+        # Fallback to string representation
+        tool_result = {"response": str(raw_result)}
+
+    print_tool_result(tool_result)
+    
+    return {
+        "type": "tool_result",
+        "tool_use_id": part.id,
+        "content": _dumps(tool_result)
+    }
+
+# =========================
+# History Compaction
+# =========================
+# Every request re-sends the whole history. Once it grows past
+# HISTORY_COMPACT_AT messages, the older part is folded into a running summary
+# written by a cheaper model, and only about the last HISTORY_KEEP messages are
+# sent verbatim. The session log still records the full conversation.
+HISTORY_COMPACT_AT = 24
+HISTORY_KEEP = 8
+SUMMARY_MODEL = "claude-3-5-haiku-20241022"
+SUMMARY_MAX_TOKENS = 500
+SUMMARY_MESSAGE_CHARS = 2000  # Per-message cap on what the summarizer reads
+
+def _message_text(content) -> str:
+    """Plain-text rendering of a message's content for the summarizer."""
+    if isinstance(content, str):
+        return content
+    parts = []
+    for block in content:
+        block = block if isinstance(block, dict) else block.model_dump()
+        if block.get("type") == "text":
+            parts.append(block["text"])
+        elif block.get("type") == "tool_use":
+            parts.append(f"[called {block['name']} with {json.dumps(block['input'], default=str)}]")
+        elif block.get("type") == "tool_result":
+            parts.append(f"[tool result: {block['content']}]")
+    return "\n".join(parts)
+
+def system_prompt(summary: str):
+    """System blocks carrying the summary; it only changes on compaction, so it is cached."""
+    if not summary:
+        return anthropic.NOT_GIVEN
+    return [{
+        "type": "text",
+        "text": f"Summary of the earlier conversation:\n{summary}",
+        "cache_control": CACHE_CONTROL
+    }]
+
+async def compact_history(history, summary):
+    """Fold the older part of a long history into the summary.
+
+    Returns the (history, summary) pair to use from now on. The cut is made
+    at a plain user prompt, so the kept messages never start with tool
+    results whose tool calls were dropped. If the summary request fails, the
+    history is kept whole and compaction is tried again next turn.
+    """
+    if len(history) <= HISTORY_COMPACT_AT:
+        return history, summary
+    
+    cut = next(
+        (i for i in range(len(history) - HISTORY_KEEP, 0, -1)
+         if history[i]["role"] == "user" and isinstance(history[i]["content"], str)),
+        None
+    )
+    if cut is None:
+        return history, summary
+    
+    lines = [f"Summary so far:\n{summary}"] if summary else []
+    lines.extend(f"{message['role']}: {_message_text(message['content'])[:SUMMARY_MESSAGE_CHARS]}" for message in history[:cut])
+    try:
+        resp = await client.messages.create(
+            model=SUMMARY_MODEL,
+            max_tokens=SUMMARY_MAX_TOKENS,
+            system="Summarize this conversation between a user and an assistant that uses tools. "
+                   "Keep facts, names, file paths, decisions and open tasks; be brief.",
+            messages=[{"role": "user", "content": "\n\n".join(lines)}]
+        )
+    except Exception as e:
+        print_error(f"Could not compact history: {e}")
+        return history, summary
+    
+    print_info(f"Compacted {cut} older messages into the conversation summary")
+    return history[cut:], "".join(p.text for p in resp.content if p.type == "text")
+
+async def run_tool_uses(manager, tool_uses):
+    """Run the tool_use blocks of one response; returns their tool_result blocks.
+
+    The calls run concurrently only when every one of them is read-only
+    (CACHEABLE_TOOLS). Otherwise they run one after another in Claude's order,
+    since a turn often chains dependent steps (create_directory then
+    write_file, git_add then git_commit) and concurrent git processes collide
+    on index.lock. A call that raises becomes an is_error result, so the
+    results of the other calls are still sent.
+    """
+    if all(manager.parse_tool_name(part.name)[1] in CACHEABLE_TOOLS for part in tool_uses):
+        results = await asyncio.gather(
+            *(execute_tool_use(manager, part) for part in tool_uses),
+            return_exceptions=True
+        )
+    else:
+        results = []
+        for part in tool_uses:
+            try:
+                results.append(await execute_tool_use(manager, part))
+            except Exception as e:
+                results.append(e)
+    
+    tool_results = []
+    for part, result in zip(tool_uses, results):
+        if isinstance(result, BaseException):
+            if not isinstance(result, Exception):
+                raise result  # Cancellation, Ctrl+C
+            print_error(f"Tool {part.name} failed: {result}")
+            tool_results.append({
+                "type": "tool_result",
+                "tool_use_id": part.id,
+                "content": f"Error: {result}",
+                "is_error": True
+            })
+        elif result is not None:
+            tool_results.append(result)
+    return tool_results
+
+# =========================
+# Batched Prompts
+# =========================
+BATCH_POLL_SECONDS = 10
+
+async def run_batch(prompts, history, tools, log_manager, summary=""):
+    """Answer queued prompts through the Message Batches API.
+
+    Batches cost about half as much as interactive calls but can take minutes
+    to finish, so this is for prompts that do not need an answer right away.
+    Each prompt is sent on its own with the conversation so far as context.
+    Tools are declared (earlier turns may contain tool calls) but disabled
+    with tool_choice "none", since a batch cannot run them. Answers are
+    added to the history and the session log in the order they were queued.
+    """
+    params = {
+        "model": MODEL,
+        "max_tokens": MAX_TOKENS,
+        "tools": tools,
+        "tool_choice": {"type": "none"}
+    }
+    if summary:
+        params["system"] = system_prompt(summary)
+    requests = [
+        {
+            "custom_id": f"prompt-{i}",
+            "params": {**params, "messages": history + [{"role": "user", "content": prompt}]}
+        }
+        for i, prompt in enumerate(prompts)
+    ]
+    batch = await client.messages.batches.create(requests=requests)
+    print_info(f"Submitted batch {batch.id} with {len(prompts)} prompt(s), waiting for results...")
+    
+    while batch.processing_status != "ended":
+        await asyncio.sleep(BATCH_POLL_SECONDS)
+        batch = await client.messages.batches.retrieve(batch.id)
+    
+    results = {entry.custom_id: entry.result async for entry in await client.messages.batches.results(batch.id)}
+    
+    for i, prompt in enumerate(prompts):
+        result = results.get(f"prompt-{i}")
+        print(Fore.WHITE + f"You (batched): {prompt}")
+        log_manager.append_message("user", prompt, {"batch": batch.id})
+        if result is None or result.type != "succeeded":
+            reason = result.type if result is not None else "missing"
+            print_error(f"Batched prompt failed ({reason})")
+            log_manager.append_message("system", f"Error: batched prompt {reason}", {"error": True, "batch": batch.id})
+            # Keep the history alternating: drop the unanswered prompt
+            continue
+        
+        text_reply = "".join([p.text for p in result.message.content if p.type == "text"])
+        print(Fore.BLUE + f"Claude: {text_reply}\n")
+        history.append({"role": "user", "content": prompt})
+        history.append({"role": "assistant", "content": text_reply})
+        log_manager.append_message("assistant", text_reply, {"batch": batch.id})
+
 # =========================
 # Setup MCP Manager
 # =========================
-async def setup_mcp():
-    manager = MCPManager()
+MCP_SERVERS = [
     # Updated paths - filesystem server should be in same directory
-    await manager.add_server("local", "../filesystem/mcp_server.py")
-    await manager.add_server("tounge", "../filesystem/tounge.py")
-    await manager.add_server("serving", "../filesystem/git_server.py")
-    await manager.add_server("game", "../Repository/MCP_VIDEOGAMES_REC_INFO/server/mcp_server.py")
-    await manager.add_server("jpgame", "../Repository/MCP_VideogameStats_Server/games/server.py")
+    ("local", "../filesystem/mcp_server.py"),
+    ("tounge", "../filesystem/tounge.py"),
+    ("serving", "../filesystem/git_server.py"),
+    ("game", "../Repository/MCP_VIDEOGAMES_REC_INFO/server/mcp_server.py"),
+    ("jpgame", "../Repository/MCP_VideogameStats_Server/games/server.py"),
     # Optional: comment out the remote server if you don't have access
-    await manager.add_server("remote", "https://flightbookingU.fastmcp.app/mcp")
+    ("remote", "https://flightbookingU.fastmcp.app/mcp"),
+]
+
+async def setup_mcp():
+    manager = MCPManager()
+    # Connect to all servers at once; startup takes as long as the slowest one
+    results = await asyncio.gather(
+        *(manager.add_server(alias, target) for alias, target in MCP_SERVERS),
+        return_exceptions=True
+    )
+    
+    # One unreachable server should not take the whole CLI down
+    for (alias, target), result in zip(MCP_SERVERS, results):
+        if isinstance(result, Exception):
+            print_error(f"Could not connect to MCP server '{alias}' ({target}): {result}")
+            manager.servers.pop(alias, None)
     return manager
 
 # =========================
 # Main Loop
 # =========================
 async def main():
+    manager = None
     try:
         manager = await setup_mcp()
         log_manager = ChatLogManager()
@@ -469,11 +1068,16 @@ async def main():
         print_heading("Chat CLI with Claude + MCP + JSON Logs")
         print_info(f"Loaded {len(tools)} tools from MCP servers")
         print_info(f"Active session: {initial_session}")
-        print_info("Commands: 'exit', 'debug', '/session new|load|list|delete|export'\n")
+        print_info("Commands: 'exit', 'debug', '/session new|load|list|delete|export', '/batch add <prompt>|run'\n")
 
         history = []
+        summary = ""      # Running summary of messages compacted out of history
+        batch_queue = []  # Prompts waiting for /batch run
 
         while True:
+            # Everything logged during the previous turn goes to disk in one write
+            log_manager.flush()
+            
             # Show session info
             try:
                 current_session = log_manager.load_current_session()
@@ -481,13 +1085,31 @@ async def main():
             except:
                 pass
                 
-            user_input = input(Fore.WHITE + "You: ")
+            user_input = await async_input(Fore.WHITE + "You: ")
             if not user_input or user_input.lower() == "exit":
                 print_info("Session ended")
                 break
             elif user_input.lower() == "debug":
                 manager.debug_tool_schemas()
                 continue
+            elif user_input.startswith("/batch"):
+                command_parts = user_input.split(maxsplit=2)
+                action = command_parts[1].lower() if len(command_parts) > 1 else ""
+                if action == "add" and len(command_parts) > 2:
+                    batch_queue.append(command_parts[2])
+                    print_info(f"Queued prompt ({len(batch_queue)} waiting); send them with /batch run")
+                elif action == "run":
+                    if not batch_queue:
+                        print_info("No queued prompts.")
+                        continue
+                    try:
+                        await run_batch(batch_queue, history, tools, log_manager, summary)
+                        batch_queue = []
+                    except Exception as e:
+                        print_error(f"Batch failed: {e}")
+                else:
+                    print_info("Batch commands: /batch add <prompt>, /batch run")
+                continue
             elif user_input.startswith("/session"):
                 result = handle_session_commands(user_input.split(), log_manager)
                 if isinstance(result, list):  # Loading session returned history
@@ -500,72 +1122,32 @@ async def main():
                             "content": msg["content"]
                         })
                     history = claude_history
+                    summary = ""
                 continue
 
             # Log user message
             log_manager.append_message("user", user_input)
             history.append({"role": "user", "content": user_input})
+            # Files may have changed since the last prompt; cached reads only
+            # serve Claude's repeats within this turn
+            manager.clear_tool_cache()
+            history, summary = await compact_history(history, summary)
+            system = system_prompt(summary)
 
             try:
-                resp = client.messages.create(
-                    model="claude-sonnet-4-20250514",
-                    max_tokens=500,
+                resp = await client.messages.create(
+                    model=MODEL,
+                    max_tokens=MAX_TOKENS,
+                    system=system,
                     tools=tools,
                     messages=history
                 )
 
-                handled = False
-                assistant_content = []
-                tool_results = []
+                assistant_content = [part for part in resp.content if part.type in ("text", "tool_use")]
+                tool_uses = [part for part in resp.content if part.type == "tool_use"]
                 
-                # Process all content parts
-                for part in resp.content:
-                    if part.type == "text":
-                        assistant_content.append(part)
-                    elif part.type == "tool_use":
-                        assistant_content.append(part)
-                        
-                        # Parse server alias and tool name from Claude's tool name
-                        server_alias, tool_name = manager.parse_tool_name(part.name)
-                        params = part.input
-
-                        print_function_call(part.name, params)
-
-                        if server_alias:
-                            raw_result = await manager.call_tool(server_alias, tool_name, params)
-                        else:
-                            print_error(f"Could not parse server alias from tool name: {part.name}")
-                            continue
-                        
-                        # Extract the actual result from the CallToolResult object
-                        if hasattr(raw_result, 'content') and raw_result.content:
-                            # Get the first content item (usually TextContent)
-                            first_content = raw_result.content[0]
-                            if hasattr(first_content, 'text'):
-                                try:
-                                    # Try to parse as JSON first
-                                    tool_result = json.loads(first_content.text)
-                                except json.JSONDecodeError:
-                                    # If not JSON, use as plain text
-                                    tool_result = {"response": first_content.text}
-                            else:
-                                tool_result = {"response": str(first_content)}
-                        elif hasattr(raw_result, 'data') and raw_result.data:
-                            # Use the structured data if available
-                            tool_result = raw_result.data
-                        else:
-                            # Fallback to string representation
-                            tool_result = {"response": str(raw_result)}
-
-                        print_tool_result(tool_result)
-                        
-                        # Collect tool result for batch processing
-                        tool_results.append({
-                            "type": "tool_result",
-                            "tool_use_id": part.id,
-                            "content": json.dumps(tool_result)
-                        })
-                        handled = True
+                tool_results = await run_tool_uses(manager, tool_uses)
+                handled = bool(tool_results)
 
                 # If we had tool calls, process them
                 if handled:
@@ -578,9 +1160,10 @@ async def main():
                     log_manager.append_message("user", tool_results, {"tool_results": True})
 
                     # Get Claude's final response
-                    followup = client.messages.create(
-                        model="claude-sonnet-4-20250514",
-                        max_tokens=500,
+                    followup = await client.messages.create(
+                        model=MODEL,
+                        max_tokens=MAX_TOKENS,
+                        system=system,
                         tools=tools,
                         messages=history
                     )
@@ -611,6 +1194,9 @@ async def main():
     except Exception as e:
         print_error(f"Failed to setup MCP manager: {e}")
         print_info("Make sure the filesystem MCP server is properly set up")
+    finally:
+        if manager is not None:
+            await manager.aclose()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file